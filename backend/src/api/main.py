@@ -9,7 +9,16 @@ from contextlib import asynccontextmanager
 
 from src.api.routes import auth, chat, assessment, dashboard, admin, profile
 from src.models.database import engine, Base
+from src.models.schema_upgrades import apply_schema_upgrades
 from src.services.qdrant_service import qdrant_service
+from src.services.crisis_service import crisis_service
+from src.services.crisis_log_writer import crisis_log_writer
+from src.services.guardian_alerts import guardian_alert_dispatcher
+from src.services.vector_indexer import vector_indexer
+from src.services.chat_deletion import chat_deletion_service
+from src.services.retention_sweeper import retention_sweeper
+from src.services.ollama_client import ollama_client
+from src.ml_models.sentiment_head import sentiment_head
 from src.utils.config import settings
 
 # Configure logging
@@ -29,16 +38,52 @@ async def lifespan(app: FastAPI):
     # Create database tables
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # Columns and indexes added to tables that already existed
+    await apply_schema_upgrades(engine)
+    
+    # Shared keep-alive connection pool to Ollama
+    await ollama_client.start()
     
     # Initialize Qdrant collections
     await qdrant_service.initialize_collections()
     
+    # Drain the vector outbox into Qdrant in the background
+    await vector_indexer.start()
+    
+    # Resume chat history deletions interrupted by a restart
+    await chat_deletion_service.start()
+    
+    # Enforce conversation / crisis log retention
+    await retention_sweeper.start()
+    
+    # Load the embedding sentiment head if it replaces VADER
+    if settings.CRISIS_SENTIMENT_BACKEND == "embedding":
+        sentiment_head.load_model()
+    
+    # Hot-reload crisis rules when the data files change
+    crisis_service.start_watcher()
+    
+    # Background writer for crisis_logs
+    await crisis_log_writer.start()
+    
+    # Guardian alert workers (cooldown index warmed from guardian_alerts)
+    await guardian_alert_dispatcher.start()
+    
     logger.info("✅ Application started successfully")
     
     yield
     
     # Shutdown
     logger.info("Shutting down application...")
+    await vector_indexer.stop()
+    await chat_deletion_service.stop()
+    await retention_sweeper.stop()
+    await guardian_alert_dispatcher.stop()
+    await crisis_log_writer.stop()
+    await crisis_service.stop_watcher()
+    crisis_service.shutdown()
+    await qdrant_service.close()
+    await ollama_client.close()
     await engine.dispose()
 
 
@@ -12,6 +12,17 @@ import logging
 from src.models.database import get_db
 from src.models.models import User, Assessment, Conversation, CrisisLog, ChatSession
 from src.api.routes.auth import get_current_user
+from src.services.crisis_service import crisis_service
+from src.services.crisis_cascade import crisis_cascade
+from src.services.crisis_log_writer import crisis_log_writer
+from src.services.guardian_alerts import guardian_alert_dispatcher
+from src.services.qdrant_service import qdrant_service
+from src.services.vector_indexer import vector_indexer
+from src.services.session_context import session_context_cache
+from src.services.chat_deletion import chat_deletion_service
+from src.services.retention_sweeper import retention_sweeper
+from src.services.ollama_client import ollama_client
+from src.services.llm_scheduler import llm_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +64,14 @@ class ConversationDetail(BaseModel):
     created_at: datetime
 
 
+class CrisisRulesetInfo(BaseModel):
+    version: str
+    keyword_count: int
+    resource_count: int
+    loaded_at: datetime
+    reloaded: bool = False
+
+
 class AssessmentDetail(BaseModel):
     id: int
     user_id: int
@@ -283,3 +302,79 @@ async def get_table_info(
     except Exception as e:
         logger.error(f"❌ Failed to get table info: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve table information")
+
+
+@router.get("/metrics", response_model=Dict[str, Any])
+async def get_runtime_metrics(
+    current_user: User = Depends(get_current_user)
+):
+    """Get in-process runtime metrics for this worker"""
+    return {
+        "crisis_scoring": crisis_service.executor_stats(),
+        "crisis_cache": crisis_service.cache_stats(),
+        "crisis_cascade": crisis_cascade.stats(),
+        "ollama": ollama_client.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "crisis_log_writer": crisis_log_writer.stats(),
+        "guardian_alerts": guardian_alert_dispatcher.stats(),
+        "qdrant": qdrant_service.stats(),
+        "session_context": session_context_cache.stats(),
+        "embedding_batcher": qdrant_service.embedding_batcher.stats(),
+        "embedding_cache": qdrant_service.embedding_cache.stats() if qdrant_service.embedding_cache else None,
+        "vector_indexer": vector_indexer.stats(),
+        "chat_deletion": chat_deletion_service.stats(),
+        "retention": retention_sweeper.stats()
+    }
+
+
+@router.post("/crisis/reload", response_model=CrisisRulesetInfo)
+async def reload_crisis_ruleset(
+    current_user: User = Depends(get_current_user),
+    force: bool = False
+):
+    """Rebuild the crisis ruleset from disk and swap it in without a restart"""
+    try:
+        reloaded = await crisis_service.reload_ruleset_async(force=force)
+        ruleset = crisis_service.ruleset
+        
+        return CrisisRulesetInfo(
+            version=ruleset.version,
+            keyword_count=ruleset.keyword_count,
+            resource_count=len(ruleset.resources),
+            loaded_at=datetime.fromtimestamp(ruleset.loaded_at),
+            reloaded=reloaded
+        )
+        
+    except Exception as e:
+        logger.error(f"❌ Crisis ruleset reload failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Ruleset reload failed: {str(e)}")
+
+
+@router.post("/vector-outbox/requeue", response_model=Dict[str, Any])
+async def requeue_vector_outbox(
+    current_user: User = Depends(get_current_user)
+):
+    """Retry outbox rows that exhausted their indexing attempts"""
+    requeued = await vector_indexer.requeue_dead_letters()
+    logger.info(f"✅ Re-queued {requeued} vector outbox rows")
+    return {"requeued": requeued}
+
+
+@router.delete("/vector-outbox/dead-letters", response_model=Dict[str, Any])
+async def purge_vector_outbox(
+    current_user: User = Depends(get_current_user)
+):
+    """Discard outbox rows that exhausted their indexing attempts"""
+    purged = await vector_indexer.purge_dead_letters()
+    logger.info(f"✅ Purged {purged} vector outbox rows")
+    return {"purged": purged}
+
+
+@router.post("/retention/sweep", response_model=Dict[str, Any], status_code=202)
+async def run_retention_sweep(
+    current_user: User = Depends(get_current_user)
+):
+    """Start a retention sweep in the background; the report appears under retention in /metrics"""
+    if not retention_sweeper.trigger():
+        raise HTTPException(status_code=409, detail="A retention sweep is already running")
+    return {"status": "started", "last_sweep": retention_sweeper.last_sweep}
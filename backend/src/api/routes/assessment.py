@@ -11,6 +11,7 @@ import logging
 from src.models.database import get_db
 from src.models.models import User, Assessment, RiskLevel
 from src.api.routes.auth import get_current_user
+from src.services.llm_scheduler import llm_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -120,6 +121,7 @@ async def submit_assessment(
         
         await db.commit()
         await db.refresh(assessment)
+        llm_scheduler.note_assessment(current_user.id)
         
         logger.info(f"✅ Assessment submitted by user {current_user.username}")
         
@@ -2,20 +2,30 @@
 Chat routes with Ollama AI and Qdrant vector storage
 """
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Set
 from datetime import datetime
-import httpx
+import asyncio
+import json
 import uuid
 import logging
 
-from src.models.database import get_db
-from src.models.models import User, Conversation, ChatSession
+from src.models.database import get_db, AsyncSessionLocal
+from src.models.models import User, Conversation, ChatSession, VectorOutbox
 from src.api.routes.auth import get_current_user
 from src.services.qdrant_service import qdrant_service
 from src.services.crisis_service import crisis_service
+from src.services.crisis_cascade import crisis_cascade
+from src.services.crisis_log_writer import crisis_log_writer
+from src.services.guardian_alerts import guardian_alert_dispatcher
+from src.services.vector_indexer import vector_indexer
+from src.services.session_context import session_context_cache
+from src.services.chat_deletion import chat_deletion_service
+from src.services.ollama_client import ollama_client
+from src.services.llm_scheduler import llm_scheduler, SchedulerRejected
 from src.ml_models.lstm_summarizer import chat_title_generator
 from src.utils.config import settings
 
@@ -23,6 +33,23 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+CRISIS_MESSAGE = (
+    "🚨 I'm really concerned about what you're sharing. Your safety is the most important thing, "
+    "and I want you to know you don't have to face this alone.\n\n"
+    "Please reach out to a crisis helpline RIGHT NOW:\n"
+    "📞 KIRAN Mental Health: 1800-599-0019 (24/7, Free)\n"
+    "📞 Sneha India: 044-24640050 (24/7)\n"
+    "📞 Vandrevala Foundation: 1860-266-2345 (24/7)\n"
+    "📞 Emergency: 112\n\n"
+    "These counselors are trained for moments like this. Please call them now. "
+    "You matter, and help is available."
+)
+
+# Strong references to detached persistence tasks
+_background_tasks: Set[asyncio.Task] = set()
+
+FALLBACK_RESPONSE = "I'm here to support you, but I'm having trouble responding right now. Please try again."
+
 
 # Pydantic models
 class ChatMessage(BaseModel):
@@ -34,6 +61,7 @@ class ChatResponse(BaseModel):
     response: str
     session_id: str
     crisis_detected: bool = False
+    crisis_message: Optional[str] = None
     crisis_resources: Optional[List[dict]] = None
 
 
@@ -45,6 +73,16 @@ class SessionMessage(BaseModel):
     crisis_detected: bool
 
 
+class DeletionJobInfo(BaseModel):
+    job_id: str
+    status: str
+    conversations_deleted: int = 0
+    sessions_deleted: int = 0
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 class ChatSessionInfo(BaseModel):
     session_id: str
     title: str
@@ -53,40 +91,130 @@ class ChatSessionInfo(BaseModel):
     last_message_at: Optional[datetime]
 
 
+def _generate_request(prompt: str, context: List[str] = None, stream: bool = False) -> Dict:
+    """Ollama /api/generate body with the recent conversation prepended"""
+    # Build context if available
+    full_prompt = prompt
+    if context:
+        context_str = "\n".join(context[-10:])  # Last 10 messages
+        full_prompt = f"Previous conversation:\n{context_str}\n\nUser: {prompt}\n\nAssistant:"
+    
+    return {
+        "model": settings.OLLAMA_MODEL,
+        "prompt": full_prompt,
+        "stream": stream,
+        "options": {
+            "temperature": 0.7,
+            "top_p": 0.9,
+        }
+    }
+
+
 # Helper function to call Ollama
 async def call_ollama_api(prompt: str, context: List[str] = None) -> str:
     """Call Ollama API for AI response"""
     try:
-        # Build context if available
-        full_prompt = prompt
-        if context:
-            context_str = "\n".join(context[-10:])  # Last 10 messages
-            full_prompt = f"Previous conversation:\n{context_str}\n\nUser: {prompt}\n\nAssistant:"
-        
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{settings.OLLAMA_API_URL}/api/generate",
-                json={
-                    "model": settings.OLLAMA_MODEL,
-                    "prompt": full_prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "top_p": 0.9,
-                    }
-                }
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "I'm here to listen and support you.")
-            else:
-                logger.error(f"Ollama API error: {response.status_code}")
-                return "I'm experiencing technical difficulties. Please try again."
+        response = await ollama_client.generate(_generate_request(prompt, context))
+        
+        if response.status_code == 200:
+            result = response.json()
+            return result.get("response", "I'm here to listen and support you.")
+        else:
+            logger.error(f"Ollama API error: {response.status_code}")
+            return "I'm experiencing technical difficulties. Please try again."
                 
     except Exception as e:
         logger.error(f"❌ Ollama API call failed: {e}")
-        return "I'm here to support you, but I'm having trouble responding right now. Please try again."
+        return FALLBACK_RESPONSE
+
+
+async def stream_ollama_api(prompt: str, context: List[str] = None) -> AsyncIterator[str]:
+    """Yield Ollama response tokens as they are generated"""
+    async with ollama_client.stream(_generate_request(prompt, context, stream=True)) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"Ollama API error: {response.status_code}")
+        
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("response"):
+                yield chunk["response"]
+            if chunk.get("done"):
+                break
+
+
+async def _assess_crisis(message_text: str) -> Dict:
+    """Crisis cascade, embedding first when the sentiment head can reuse the vector"""
+    user_vector = None
+    if crisis_service.uses_embedding_sentiment:
+        user_vector = await qdrant_service.create_embedding_async(message_text)
+    return await crisis_cascade.assess(message_text, embedding=user_vector)
+
+
+def _report_crisis(user: User, message_text: str, crisis_result: Dict):
+    """Alert the guardian and log the crisis event (both in the background)"""
+    logger.warning(f"⚠️ CRISIS DETECTED for user {user.id}: {message_text[:50]}...")
+    llm_scheduler.note_crisis(user.id)
+    guardian_alerted = guardian_alert_dispatcher.submit(
+        user_id=user.id,
+        guardian_contact=user.guardian_contact,
+        display_name=user.full_name or user.username
+    )
+    crisis_log_writer.submit(
+        user_id=user.id,
+        message_text=message_text,
+        crisis_score=crisis_result.get("score", 0),
+        keywords_detected=crisis_result.get("keywords_detected", []),
+        action_taken="guardian_alerted" if guardian_alerted else "resource_provided"
+    )
+
+
+async def _save_turn(
+    db: AsyncSession,
+    user_id: int,
+    session_id: str,
+    message_text: str,
+    sender: str,
+    crisis_detected: bool = False,
+    sentiment_score: Optional[float] = None
+) -> Conversation:
+    """Add one message (queued for Qdrant indexing) and count it on the chat session; caller commits"""
+    conversation = Conversation(
+        user_id=user_id,
+        session_id=session_id,
+        message_text=message_text,
+        sender=sender,
+        crisis_detected=crisis_detected,
+        sentiment_score=sentiment_score
+    )
+    db.add(conversation)
+    await db.flush()
+    
+    # Queue for Qdrant indexing in the same transaction (vector_indexer drains it)
+    db.add(VectorOutbox(conversation_id=conversation.id))
+    
+    # Update or create chat session
+    result = await db.execute(
+        select(ChatSession).where(ChatSession.session_id == session_id)
+    )
+    chat_session = result.scalar_one_or_none()
+    
+    if not chat_session:
+        # Create new session
+        chat_session = ChatSession(
+            user_id=user_id,
+            session_id=session_id,
+            message_count=1,
+            last_message_at=datetime.utcnow()
+        )
+        db.add(chat_session)
+    else:
+        # Update existing session
+        chat_session.message_count += 1
+        chat_session.last_message_at = datetime.utcnow()
+    
+    return conversation
 
 
 @router.post("/message", response_model=ChatResponse)
@@ -96,122 +224,247 @@ async def send_message(
     db: AsyncSession = Depends(get_db)
 ):
     """Send message and get AI response"""
+    generation: Optional[asyncio.Task] = None
     try:
         # Generate or use existing session ID
         session_id = message_data.session_id or str(uuid.uuid4())
         
-        # Check for crisis
-        crisis_result = crisis_service.detect_crisis(message_data.message)
-        crisis_detected = crisis_result.get("is_crisis", False)
+        # End the read transaction opened by authentication so no pooled connection
+        # is held while the crisis check and the LLM run
+        await db.commit()
         
-        # Get conversation context from Qdrant
-        context_messages = await qdrant_service.get_session_context(session_id, limit=10)
+        # Crisis check, context retrieval and the user's queue priority run concurrently
+        crisis_result, context_messages, priority = await asyncio.gather(
+            _assess_crisis(message_data.message),
+            session_context_cache.get(current_user.id, session_id),
+            llm_scheduler.priority_for(current_user.id)
+        )
+        crisis_detected = crisis_result.get("is_crisis", False)
         context = [f"{msg['sender']}: {msg['message_text']}" for msg in context_messages]
         
+        # Crisis override: answer with helplines right away and skip generation entirely
+        crisis_message = None
+        if crisis_detected:
+            crisis_message = CRISIS_MESSAGE
+            # Log crisis event (written to crisis_logs in the background)
+            _report_crisis(current_user, message_data.message, crisis_result)
+        else:
+            # Wait for a generation slot before anything is written, so a rejected
+            # request leaves no unanswered turn behind
+            granted_at = await llm_scheduler.acquire(priority)
+            # Start generation now; persistence below overlaps with it
+            generation = asyncio.create_task(call_ollama_api(message_data.message, context))
+            generation.add_done_callback(lambda _: llm_scheduler.release(granted_at))
+        
         # Save user message
-        user_conversation = Conversation(
-            user_id=current_user.id,
-            session_id=session_id,
-            message_text=message_data.message,
-            sender="user",
+        user_conversation = await _save_turn(
+            db,
+            current_user.id,
+            session_id,
+            message_data.message,
+            "user",
             crisis_detected=crisis_detected,
             sentiment_score=crisis_result.get("score", 0.0)
         )
-        db.add(user_conversation)
-        await db.flush()
-        
-        # Add to Qdrant
-        vector_id = await qdrant_service.add_conversation(
-            conversation_id=user_conversation.id,
-            user_id=current_user.id,
-            session_id=session_id,
-            message_text=message_data.message,
-            sender="user",
-            metadata={"crisis_detected": crisis_detected}
-        )
-        user_conversation.vector_id = vector_id
-        
-        # Get AI response from Ollama
-        ai_response = await call_ollama_api(message_data.message, context)
         
-        # If crisis detected, override with crisis response
-        crisis_message = None
         if crisis_detected:
-            crisis_message = (
-                "🚨 I'm really concerned about what you're sharing. Your safety is the most important thing, "
-                "and I want you to know you don't have to face this alone.\n\n"
-                "Please reach out to a crisis helpline RIGHT NOW:\n"
-                "📞 KIRAN Mental Health: 1800-599-0019 (24/7, Free)\n"
-                "📞 Sneha India: 044-24640050 (24/7)\n"
-                "📞 Vandrevala Foundation: 1860-266-2345 (24/7)\n"
-                "📞 Emergency: 112\n\n"
-                "These counselors are trained for moments like this. Please call them now. "
-                "You matter, and help is available."
-            )
-            # Log crisis event
-            logger.warning(f"⚠️ CRISIS DETECTED for user {current_user.id}: {message_data.message[:50]}...")
-            
-            # Override AI response with crisis message
+            # Both turns in one short transaction
             ai_response = crisis_message
+            ai_conversation = await _save_turn(db, current_user.id, session_id, ai_response, "ai")
+            await db.commit()
+        else:
+            # Commit the user turn so no pooled connection is held while the LLM generates
+            await db.commit()
+            vector_indexer.notify()
+            
+            # Get AI response from Ollama
+            ai_response = await generation
+            
+            # Save AI response in a second short transaction
+            ai_conversation = await _save_turn(db, current_user.id, session_id, ai_response, "ai")
+            await db.commit()
         
-        # Save AI response
-        ai_conversation = Conversation(
-            user_id=current_user.id,
-            session_id=session_id,
-            message_text=ai_response,
-            sender="ai",
-            crisis_detected=False
-        )
-        db.add(ai_conversation)
-        await db.flush()
+        vector_indexer.notify()
+        
+        for turn in (user_conversation, ai_conversation):
+            session_context_cache.append(current_user.id, session_id, turn.id, turn.sender, turn.message_text)
         
-        # Add AI response to Qdrant
-        ai_vector_id = await qdrant_service.add_conversation(
-            conversation_id=ai_conversation.id,
-            user_id=current_user.id,
+        # Prepare response
+        response_data = ChatResponse(
+            response=ai_response,
             session_id=session_id,
-            message_text=ai_response,
-            sender="ai"
+            crisis_detected=crisis_detected,
+            crisis_message=crisis_message,
+            crisis_resources=crisis_result.get("resources", []) if crisis_detected else None
         )
-        ai_conversation.vector_id = ai_vector_id
         
-        # Update or create chat session
-        result = await db.execute(
-            select(ChatSession).where(ChatSession.session_id == session_id)
+        logger.info(f"✅ Message processed for user {current_user.username}, session {session_id}")
+        
+        return response_data
+        
+    except SchedulerRejected as e:
+        logger.warning(f"⚠️ {e} for user {current_user.id}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The assistant is busy right now. Please try again shortly.",
+            headers={"Retry-After": str(e.retry_after)}
         )
-        chat_session = result.scalar_one_or_none()
-        
-        if not chat_session:
-            # Create new session
-            chat_session = ChatSession(
-                user_id=current_user.id,
-                session_id=session_id,
-                message_count=2,
-                last_message_at=datetime.utcnow()
-            )
-            db.add(chat_session)
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"❌ Message processing failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to process message"
+        )
+    finally:
+        if generation is not None and not generation.done():
+            generation.cancel()
+
+
+def _stream_event(event_type: str, **fields) -> str:
+    """One NDJSON line"""
+    return json.dumps({"type": event_type, **fields}) + "\n"
+
+
+async def _persist_streamed_reply(user_id: int, session_id: str, ai_response: str) -> int:
+    """Save a finished streamed reply in its own session (the request's session is closed by now)"""
+    async with AsyncSessionLocal() as db:
+        ai_conversation = await _save_turn(db, user_id, session_id, ai_response, "ai")
+        await db.commit()
+    
+    vector_indexer.notify()
+    session_context_cache.append(user_id, session_id, ai_conversation.id, "ai", ai_response)
+    return ai_conversation.id
+
+
+async def _stream_reply(
+    user_id: int,
+    session_id: str,
+    message_text: str,
+    context: List[str],
+    crisis_result: Dict,
+    priority: int
+) -> AsyncIterator[str]:
+    """Forward tokens as they arrive, then persist the full reply and send a done event"""
+    crisis_detected = crisis_result.get("is_crisis", False)
+    parts: List[str] = []
+    persisting = False
+    truncated = False
+    
+    yield _stream_event("start", session_id=session_id, crisis_detected=crisis_detected)
+    
+    try:
+        if crisis_detected:
+            parts.append(CRISIS_MESSAGE)
+            yield _stream_event("token", content=CRISIS_MESSAGE)
         else:
-            # Update existing session
-            chat_session.message_count += 2
-            chat_session.last_message_at = datetime.utcnow()
+            try:
+                granted_at = await llm_scheduler.acquire(priority)
+                try:
+                    async for token in stream_ollama_api(message_text, context):
+                        parts.append(token)
+                        yield _stream_event("token", content=token)
+                finally:
+                    llm_scheduler.release(granted_at)
+            except Exception as e:
+                logger.error(f"❌ Ollama streaming failed: {e}")
+                if not parts:
+                    parts.append(FALLBACK_RESPONSE)
+                    yield _stream_event("token", content=FALLBACK_RESPONSE)
+                else:
+                    # The client already has part of a reply; say it was cut short
+                    truncated = True
+                    yield _stream_event("error", detail="Response was interrupted", truncated=True)
+        
+        # Runs as its own task so a disconnect during the save doesn't cancel it
+        persist = asyncio.ensure_future(_persist_streamed_reply(user_id, session_id, "".join(parts)))
+        _background_tasks.add(persist)
+        persist.add_done_callback(_background_tasks.discard)
+        persisting = True
+        try:
+            conversation_id = await asyncio.shield(persist)
+        except Exception as e:
+            logger.error(f"❌ Failed to save streamed reply: {e}")
+            yield _stream_event("error", detail="Failed to save response")
+            return
+        
+        done = {
+            "session_id": session_id,
+            "conversation_id": conversation_id,
+            "crisis_detected": crisis_detected,
+            "truncated": truncated
+        }
+        if crisis_detected:
+            done["crisis_resources"] = crisis_result.get("resources", [])
+        yield _stream_event("done", **done)
+        
+    finally:
+        # Client went away mid-stream: keep what was generated so the transcript stays whole
+        if not persisting and parts:
+            task = asyncio.ensure_future(_persist_streamed_reply(user_id, session_id, "".join(parts)))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
+
+@router.post("/message/stream")
+async def send_message_stream(
+    message_data: ChatMessage,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Send message and stream the AI response as NDJSON events:
+    start, token (repeated), then done. An error event comes before done when
+    the reply was cut short, or replaces it when the reply could not be saved.
+    """
+    try:
+        # Generate or use existing session ID
+        session_id = message_data.session_id or str(uuid.uuid4())
         
+        # End the read transaction opened by authentication so no pooled connection
+        # is held while the crisis check and the LLM run
         await db.commit()
         
-        # Prepare response
-        response_data = ChatResponse(
-            response=ai_response,
-            session_id=session_id,
-            crisis_detected=crisis_detected
+        # Crisis check, context retrieval and the user's queue priority run concurrently
+        crisis_result, context_messages, priority = await asyncio.gather(
+            _assess_crisis(message_data.message),
+            session_context_cache.get(current_user.id, session_id),
+            llm_scheduler.priority_for(current_user.id)
         )
+        crisis_detected = crisis_result.get("is_crisis", False)
+        context = [f"{msg['sender']}: {msg['message_text']}" for msg in context_messages]
         
-        if crisis_detected:
-            response_data.crisis_message = crisis_message
-            response_data.crisis_resources = crisis_result.get("resources", [])
+        # Turn the request away before saving anything if it could not even be queued
+        if not crisis_detected:
+            llm_scheduler.check_admission(priority)
         
-        logger.info(f"✅ Message processed for user {current_user.username}, session {session_id}")
+        # Save user message before streaming starts
+        user_conversation = await _save_turn(
+            db,
+            current_user.id,
+            session_id,
+            message_data.message,
+            "user",
+            crisis_detected=crisis_detected,
+            sentiment_score=crisis_result.get("score", 0.0)
+        )
+        await db.commit()
         
-        return response_data
+        vector_indexer.notify()
+        session_context_cache.append(
+            current_user.id, session_id, user_conversation.id, "user", message_data.message
+        )
+        
+        if crisis_detected:
+            _report_crisis(current_user, message_data.message, crisis_result)
         
+    except SchedulerRejected as e:
+        logger.warning(f"⚠️ {e} for user {current_user.id}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The assistant is busy right now. Please try again shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         await db.rollback()
         logger.error(f"❌ Message processing failed: {e}")
@@ -219,6 +472,12 @@ async def send_message(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to process message"
         )
+    
+    return StreamingResponse(
+        _stream_reply(current_user.id, session_id, message_data.message, context, crisis_result, priority),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.get("/history/{session_id}", response_model=List[SessionMessage])
@@ -314,31 +573,10 @@ async def delete_chat_session(
 ):
     """Delete a chat session"""
     try:
-        # Delete conversations from database
-        result = await db.execute(
-            select(Conversation)
-            .where(Conversation.session_id == session_id)
-            .where(Conversation.user_id == current_user.id)
-        )
-        conversations = result.scalars().all()
-        
-        for conv in conversations:
-            await db.delete(conv)
-        
-        # Delete session
-        result = await db.execute(
-            select(ChatSession)
-            .where(ChatSession.session_id == session_id)
-            .where(ChatSession.user_id == current_user.id)
-        )
-        session = result.scalar_one_or_none()
-        
-        if session:
-            await db.delete(session)
-        
-        await db.commit()
+        # Set-based delete in Postgres, then one filtered delete in Qdrant
+        deleted = await chat_deletion_service.delete_session(db, current_user.id, session_id)
         
-        logger.info(f"✅ Deleted session {session_id}")
+        logger.info(f"✅ Deleted session {session_id} ({deleted} messages)")
         
         return {"message": "Session deleted successfully"}
         
@@ -349,3 +587,46 @@ async def delete_chat_session(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to delete session"
         )
+
+
+@router.delete("/history", response_model=DeletionJobInfo, status_code=status.HTTP_202_ACCEPTED)
+async def delete_chat_history(
+    current_user: User = Depends(get_current_user)
+):
+    """Delete all of the current user's chat history in the background"""
+    try:
+        job_id = await chat_deletion_service.submit_user_history(current_user.id)
+        logger.info(f"✅ Queued chat history deletion {job_id} for user {current_user.id}")
+        return DeletionJobInfo(job_id=job_id, status="queued")
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to queue chat history deletion: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete chat history"
+        )
+
+
+@router.get("/deletions/{job_id}", response_model=DeletionJobInfo)
+async def get_deletion_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the status of a chat history deletion"""
+    job = await chat_deletion_service.get_job(db, current_user.id, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Deletion job not found"
+        )
+    
+    return DeletionJobInfo(
+        job_id=job.id,
+        status=job.status,
+        conversations_deleted=job.conversations_deleted or 0,
+        sessions_deleted=job.sessions_deleted or 0,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at
+    )
@@ -0,0 +1,202 @@
+"""
+Resumable crisis re-scan over the conversations table
+
+Reads user messages out of Postgres in id order, one bounded keyset window per
+short read transaction, rescores them with the current crisis ruleset and
+writes back changed crisis_detected / sentiment_score values, logging newly
+flagged messages to crisis_logs. The throttle only sleeps once the window's
+read transaction is closed. Progress is checkpointed after every committed batch.
+
+Usage:
+    python -m src.jobs.crisis_rescan [--batch-size N] [--max-rows-per-sec N] [--reset]
+"""
+from sqlalchemy import select, update, insert
+from typing import Dict, List
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from src.models.database import AsyncSessionLocal, engine
+from src.models.models import Conversation, CrisisLog
+from src.services.crisis_service import crisis_service
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CrisisRescanJob:
+    """Keyset-ordered, throttled, checkpointed crisis re-scan"""
+
+    def __init__(
+        self,
+        batch_size: int = settings.CRISIS_RESCAN_BATCH_SIZE,
+        window_size: int = settings.CRISIS_RESCAN_WINDOW_SIZE,
+        max_rows_per_sec: int = settings.CRISIS_RESCAN_MAX_ROWS_PER_SEC,
+        checkpoint_path: str = settings.CRISIS_RESCAN_CHECKPOINT_PATH,
+        dry_run: bool = False
+    ):
+        self.batch_size = batch_size
+        self.window_size = max(window_size, batch_size)
+        self.max_rows_per_sec = max_rows_per_sec
+        self.checkpoint_path = Path(checkpoint_path)
+        self.dry_run = dry_run
+
+        self.last_id = 0
+        self.stats = {"scanned": 0, "updated": 0, "newly_flagged": 0, "cleared": 0}
+        self._stopping = False
+
+    def load_checkpoint(self):
+        """Resume from the last committed id, if a checkpoint exists"""
+        if self.checkpoint_path.exists():
+            with open(self.checkpoint_path, 'r') as f:
+                data = json.load(f)
+            self.last_id = data.get("last_id", 0)
+            self.stats.update(data.get("stats", {}))
+            logger.info(f"Resuming crisis rescan after conversation id {self.last_id}")
+
+    def save_checkpoint(self):
+        """Atomically persist progress"""
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"last_id": self.last_id, "stats": self.stats}, f)
+        tmp_path.replace(self.checkpoint_path)
+
+    def stop(self):
+        """Request a graceful stop after the current batch"""
+        self._stopping = True
+
+    async def run(self) -> Dict:
+        """Rescan until the table is exhausted or stop() is called"""
+        started = time.monotonic()
+        processed_since_start = 0
+
+        while not self._stopping:
+            # One short read transaction per keyset window, closed before any batch is processed
+            async with AsyncSessionLocal() as read_session:
+                result = await read_session.execute(
+                    select(
+                        Conversation.id,
+                        Conversation.user_id,
+                        Conversation.message_text,
+                        Conversation.crisis_detected,
+                        Conversation.sentiment_score
+                    )
+                    .where(Conversation.sender == "user")
+                    .where(Conversation.id > self.last_id)
+                    .order_by(Conversation.id.asc())
+                    .limit(self.window_size)
+                )
+                window = result.all()
+            rows_in_window = len(window)
+
+            for start in range(0, rows_in_window, self.batch_size):
+                rows = window[start:start + self.batch_size]
+                await self._process_batch(rows)
+                processed_since_start += len(rows)
+
+                await self._throttle(started, processed_since_start)
+                if self._stopping:
+                    break
+
+            if rows_in_window < self.window_size:
+                break
+
+        logger.info(f"✅ Crisis rescan stopped at id {self.last_id}: {self.stats}")
+        return self.stats
+
+    async def _process_batch(self, rows: List):
+        """Rescore one batch and write back what changed"""
+        batch = crisis_service.detect_crisis_batch([row.message_text for row in rows])
+
+        updates = []
+        crisis_logs = []
+
+        for index, row in enumerate(rows):
+            is_crisis = bool(batch.is_crisis[index])
+            score = float(batch.scores[index])
+
+            if is_crisis == bool(row.crisis_detected) and row.sentiment_score is not None \
+                    and abs(row.sentiment_score - score) < 1e-6:
+                continue
+
+            updates.append({"id": row.id, "crisis_detected": is_crisis, "sentiment_score": score})
+
+            if is_crisis and not row.crisis_detected:
+                self.stats["newly_flagged"] += 1
+                crisis_logs.append({
+                    "user_id": row.user_id,
+                    "message_text": row.message_text,
+                    "crisis_score": int(score),
+                    "keywords_detected": json.dumps(batch.keywords_for(index)),
+                    "action_taken": "rescan_flagged"
+                })
+            elif row.crisis_detected and not is_crisis:
+                self.stats["cleared"] += 1
+
+        if updates and not self.dry_run:
+            async with AsyncSessionLocal() as write_session:
+                # Executemany UPDATE keyed on primary key
+                await write_session.execute(update(Conversation), updates)
+                if crisis_logs:
+                    await write_session.execute(insert(CrisisLog), crisis_logs)
+                await write_session.commit()
+
+        self.stats["scanned"] += len(rows)
+        self.stats["updated"] += len(updates)
+        self.last_id = rows[-1].id
+        if not self.dry_run:
+            self.save_checkpoint()
+
+    async def _throttle(self, started: float, processed: int):
+        """Sleep so the average rate stays under max_rows_per_sec"""
+        if self.max_rows_per_sec <= 0:
+            return
+
+        expected_elapsed = processed / self.max_rows_per_sec
+        actual_elapsed = time.monotonic() - started
+        if expected_elapsed > actual_elapsed:
+            await asyncio.sleep(expected_elapsed - actual_elapsed)
+
+
+async def main(args: argparse.Namespace):
+    """CLI entry point"""
+    job = CrisisRescanJob(
+        batch_size=args.batch_size,
+        window_size=args.window_size,
+        max_rows_per_sec=args.max_rows_per_sec,
+        checkpoint_path=args.checkpoint,
+        dry_run=args.dry_run
+    )
+
+    if args.reset and job.checkpoint_path.exists():
+        job.checkpoint_path.unlink()
+    job.load_checkpoint()
+
+    try:
+        await job.run()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Rescore stored conversations with the current crisis ruleset")
+    parser.add_argument("--batch-size", type=int, default=settings.CRISIS_RESCAN_BATCH_SIZE)
+    parser.add_argument("--window-size", type=int, default=settings.CRISIS_RESCAN_WINDOW_SIZE)
+    parser.add_argument("--max-rows-per-sec", type=int, default=settings.CRISIS_RESCAN_MAX_ROWS_PER_SEC,
+                        help="Throughput ceiling so the rescan does not compete with live traffic (0 = unthrottled)")
+    parser.add_argument("--checkpoint", default=settings.CRISIS_RESCAN_CHECKPOINT_PATH)
+    parser.add_argument("--reset", action="store_true", help="Ignore any existing checkpoint and start from the beginning")
+    parser.add_argument("--dry-run", action="store_true", help="Score and report without writing changes")
+
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        logger.info("Crisis rescan interrupted; rerun to resume from the checkpoint")
@@ -0,0 +1,405 @@
+"""
+Bulk rebuild of the conversations vector collection from Postgres
+
+Streams every Conversation row in id order through a server-side cursor,
+embeds each batch in one or more encoder worker processes and upserts the
+points into a fresh collection with wait=False requests, several in flight at
+once. When the copy is done, QDRANT_COLLECTION_NAME is switched to the new
+collection with a single atomic alias update, then a catch-up pass picks up
+rows written while the copy was running.
+
+Progress (target collection and last indexed id) is checkpointed after every
+batch, so an interrupted run resumes into the same collection.
+
+Usage:
+    python -m src.jobs.reindex_qdrant [--workers N] [--batch-size N] [--reset]
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from qdrant_client.models import (
+    PointStruct,
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation
+)
+from sqlalchemy import select, update
+from collections import deque
+from typing import Dict, List, Optional
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import time
+
+import numpy as np
+
+from src.models.database import AsyncSessionLocal, engine
+from src.models.models import Conversation
+from src.services.qdrant_service import qdrant_service
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress reports
+REPORT_INTERVAL_SECONDS = 10.0
+
+# Encoder owned by each worker (process or thread), loaded by the pool initializer
+_worker_encoder = None
+
+
+def _init_encoder(model_name: str):
+    """Pool initializer: load the sentence transformer once per worker"""
+    global _worker_encoder
+    from sentence_transformers import SentenceTransformer
+    _worker_encoder = SentenceTransformer(model_name)
+
+
+def _encode_texts(texts: List[str], batch_size: int) -> np.ndarray:
+    """Embed a batch of texts in a worker"""
+    return _worker_encoder.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True
+    ).astype(np.float32)
+
+
+class QdrantReindexJob:
+    """Streamed, pipelined, checkpointed rebuild of the conversations collection"""
+
+    def __init__(
+        self,
+        batch_size: int = settings.REINDEX_BATCH_SIZE,
+        window_size: int = settings.REINDEX_WINDOW_SIZE,
+        encode_batch_size: int = settings.REINDEX_ENCODE_BATCH_SIZE,
+        workers: int = settings.REINDEX_WORKERS,
+        upsert_batch_size: int = settings.REINDEX_UPSERT_BATCH_SIZE,
+        parallel_upserts: int = settings.REINDEX_PARALLEL_UPSERTS,
+        checkpoint_path: str = settings.REINDEX_CHECKPOINT_PATH,
+        target_collection: Optional[str] = None,
+        drop_legacy_collection: bool = False,
+        delete_old: bool = False
+    ):
+        self.batch_size = batch_size
+        self.window_size = max(window_size, batch_size)
+        self.encode_batch_size = encode_batch_size
+        self.workers = max(1, workers)
+        self.upsert_batch_size = upsert_batch_size
+        self.checkpoint_path = Path(checkpoint_path)
+        self.target_collection = target_collection
+        self.drop_legacy_collection = drop_legacy_collection
+        self.delete_old = delete_old
+
+        self.alias_name = settings.QDRANT_COLLECTION_NAME
+        self.last_id = 0
+        self.stats = {"indexed": 0, "vector_ids_backfilled": 0}
+        self._upsert_slots = asyncio.Semaphore(max(1, parallel_upserts))
+        self._stopping = False
+
+    def load_checkpoint(self):
+        """Resume into the same target collection after the last indexed id"""
+        if self.checkpoint_path.exists():
+            with open(self.checkpoint_path, 'r') as f:
+                data = json.load(f)
+            self.last_id = data.get("last_id", 0)
+            self.target_collection = data.get("target_collection") or self.target_collection
+            self.stats.update(data.get("stats", {}))
+            logger.info(f"Resuming reindex into {self.target_collection} after conversation id {self.last_id}")
+
+    def save_checkpoint(self):
+        """Atomically persist progress"""
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                "target_collection": self.target_collection,
+                "last_id": self.last_id,
+                "stats": self.stats
+            }, f)
+        tmp_path.replace(self.checkpoint_path)
+
+    def stop(self):
+        """Request a graceful stop after the in-flight batches"""
+        self._stopping = True
+
+    def _create_executor(self) -> Executor:
+        """Encoder pool: separate processes when workers > 1, else one in-process thread"""
+        if self.workers > 1:
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_encoder,
+                initargs=(settings.EMBEDDING_MODEL_NAME,)
+            )
+        return ThreadPoolExecutor(
+            max_workers=1,
+            initializer=_init_encoder,
+            initargs=(settings.EMBEDDING_MODEL_NAME,)
+        )
+
+    async def _prepare_target(self):
+        """Check the alias can be switched, then create the target collection if needed"""
+        client = qdrant_service.connect()
+        collection_names = {col.name for col in (await client.get_collections()).collections}
+
+        if (
+            self.alias_name in collection_names
+            and await qdrant_service.resolve_alias(self.alias_name) is None
+            and not self.drop_legacy_collection
+        ):
+            raise RuntimeError(
+                f"{self.alias_name} is a collection, not an alias; rerun with "
+                f"--drop-legacy-collection to replace it when the new collection is ready"
+            )
+
+        if self.target_collection is None:
+            self.target_collection = f"{self.alias_name}_{time.strftime('%Y%m%d%H%M%S')}"
+        if self.target_collection not in collection_names:
+            await qdrant_service.create_collection(self.target_collection)
+
+    async def run(self) -> Dict:
+        """Copy, switch the alias, then catch up on rows written during the copy"""
+        await self._prepare_target()
+        self.save_checkpoint()
+
+        executor = self._create_executor()
+        try:
+            await self._copy(executor)
+            if self._stopping:
+                logger.info(f"Reindex stopped at id {self.last_id}; rerun to resume")
+                return self.stats
+
+            await self._wait_until_applied()
+            old_collection = await self.switch_alias()
+
+            # Rows committed during the copy were indexed into the old collection
+            await self._copy(executor)
+            if self._stopping:
+                return self.stats
+
+            if self.delete_old and old_collection is not None:
+                await qdrant_service.client.delete_collection(old_collection)
+                logger.info(f"✅ Deleted previous collection {old_collection}")
+
+            self.checkpoint_path.unlink(missing_ok=True)
+        finally:
+            executor.shutdown(wait=True)
+
+        logger.info(f"✅ Reindex into {self.target_collection} complete: {self.stats}")
+        return self.stats
+
+    async def _copy(self, executor: Executor):
+        """Stream rows after last_id, keeping several encode/upsert batches in flight"""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        last_report = started
+        copied = 0
+        pending: deque = deque()
+        max_in_flight = self.workers + 1
+
+        while not self._stopping:
+            rows_in_window = 0
+            window_start = self.last_id if not pending else pending[-1][0]
+
+            # One read transaction per keyset window, streamed in partitions
+            async with AsyncSessionLocal() as read_session:
+                result = await read_session.stream(
+                    select(
+                        Conversation.id,
+                        Conversation.user_id,
+                        Conversation.session_id,
+                        Conversation.message_text,
+                        Conversation.sender,
+                        Conversation.crisis_detected,
+                        Conversation.created_at,
+                        Conversation.vector_id
+                    )
+                    .where(Conversation.id > window_start)
+                    .order_by(Conversation.id.asc())
+                    .limit(self.window_size)
+                    .execution_options(yield_per=self.batch_size)
+                )
+
+                async for rows in result.partitions(self.batch_size):
+                    rows_in_window += len(rows)
+                    encoded = loop.run_in_executor(
+                        executor,
+                        _encode_texts,
+                        [row.message_text for row in rows],
+                        self.encode_batch_size
+                    )
+                    pending.append((rows[-1].id, asyncio.create_task(self._index_batch(rows, encoded))))
+
+                    # Complete batches in order so the checkpoint never skips a gap
+                    while len(pending) >= max_in_flight:
+                        copied += await self._complete(pending.popleft())
+
+                    now = time.monotonic()
+                    if now - last_report >= REPORT_INTERVAL_SECONDS:
+                        self._report(copied, now - started)
+                        last_report = now
+
+                    if self._stopping:
+                        break
+
+            if rows_in_window < self.window_size:
+                break
+
+        while pending:
+            copied += await self._complete(pending.popleft())
+        self._report(copied, time.monotonic() - started)
+
+    async def _complete(self, entry) -> int:
+        """Await a batch, then advance and persist the checkpoint"""
+        last_id, task = entry
+        count = await task
+        self.last_id = last_id
+        self.stats["indexed"] += count
+        self.save_checkpoint()
+        return count
+
+    async def _index_batch(self, rows: List, encoded: asyncio.Future) -> int:
+        """Upsert one embedded batch in parallel chunks and backfill missing vector_ids"""
+        vectors = await encoded
+
+        # Keep existing point ids so vector_id values in Postgres stay valid
+        point_ids = [row.vector_id or qdrant_service.point_id_for(row.id) for row in rows]
+        points = [
+            PointStruct(
+                id=point_id,
+                vector=vector.tolist(),
+                payload=qdrant_service._conversation_payload(
+                    row.id,
+                    row.user_id,
+                    row.session_id,
+                    row.message_text,
+                    row.sender,
+                    {"crisis_detected": bool(row.crisis_detected)} if row.sender == "user" else None,
+                    row.created_at
+                )
+            )
+            for row, point_id, vector in zip(rows, point_ids, vectors)
+        ]
+
+        await asyncio.gather(*[
+            self._upsert(points[start:start + self.upsert_batch_size])
+            for start in range(0, len(points), self.upsert_batch_size)
+        ])
+
+        backfill = [
+            {"id": row.id, "vector_id": point_id}
+            for row, point_id in zip(rows, point_ids)
+            if row.vector_id is None
+        ]
+        if backfill:
+            async with AsyncSessionLocal() as write_session:
+                await write_session.execute(update(Conversation), backfill)
+                await write_session.commit()
+            self.stats["vector_ids_backfilled"] += len(backfill)
+
+        return len(rows)
+
+    async def _upsert(self, points: List[PointStruct]):
+        """Fire-and-forget upsert (wait=False), bounded by the parallel request limit"""
+        async with self._upsert_slots:
+            await qdrant_service.client.upsert(
+                collection_name=self.target_collection,
+                points=points,
+                wait=False
+            )
+
+    async def _wait_until_applied(self, timeout: float = 300.0):
+        """wait=False only acknowledges receipt; wait until the points are visible"""
+        deadline = time.monotonic() + timeout
+        while True:
+            count = (await qdrant_service.client.count(self.target_collection, exact=True)).count
+            if count >= self.stats["indexed"] or time.monotonic() > deadline:
+                break
+            await asyncio.sleep(1.0)
+
+        if count < self.stats["indexed"]:
+            logger.warning(
+                f"⚠️ {self.target_collection} has {count} points, expected {self.stats['indexed']}; switching anyway"
+            )
+
+    async def switch_alias(self) -> Optional[str]:
+        """Point the alias at the target collection; returns the previous collection"""
+        client = qdrant_service.client
+        previous = await qdrant_service.resolve_alias(self.alias_name)
+        operations = []
+
+        if previous is not None:
+            operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=self.alias_name)))
+        elif self.alias_name in {col.name for col in (await client.get_collections()).collections}:
+            # An alias cannot shadow a real collection, so this first switch is not atomic
+            logger.warning(f"⚠️ Dropping legacy collection {self.alias_name} to replace it with an alias")
+            await client.delete_collection(self.alias_name)
+
+        operations.append(CreateAliasOperation(
+            create_alias=CreateAlias(collection_name=self.target_collection, alias_name=self.alias_name)
+        ))
+        await client.update_collection_aliases(change_aliases_operations=operations)
+
+        logger.info(f"✅ Alias {self.alias_name} now points to {self.target_collection}")
+        return previous if previous != self.target_collection else None
+
+    def _report(self, copied: int, elapsed: float):
+        """Log throughput for the current pass"""
+        rate = copied / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            f"Reindexed {copied} rows in {elapsed:.1f}s ({rate:.0f} rows/sec), "
+            f"last id {self.last_id}, total {self.stats['indexed']}"
+        )
+
+
+async def main(args: argparse.Namespace):
+    """CLI entry point"""
+    job = QdrantReindexJob(
+        batch_size=args.batch_size,
+        window_size=args.window_size,
+        encode_batch_size=args.encode_batch_size,
+        workers=args.workers,
+        upsert_batch_size=args.upsert_batch_size,
+        parallel_upserts=args.parallel_upserts,
+        checkpoint_path=args.checkpoint,
+        target_collection=args.target,
+        drop_legacy_collection=args.drop_legacy_collection,
+        delete_old=args.delete_old
+    )
+
+    if args.reset and job.checkpoint_path.exists():
+        job.checkpoint_path.unlink()
+    job.load_checkpoint()
+
+    try:
+        await job.run()
+    finally:
+        await qdrant_service.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Rebuild the Qdrant conversations collection from Postgres")
+    parser.add_argument("--batch-size", type=int, default=settings.REINDEX_BATCH_SIZE)
+    parser.add_argument("--window-size", type=int, default=settings.REINDEX_WINDOW_SIZE)
+    parser.add_argument("--encode-batch-size", type=int, default=settings.REINDEX_ENCODE_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=settings.REINDEX_WORKERS,
+                        help="Embedding worker processes (1 = encode in this process)")
+    parser.add_argument("--upsert-batch-size", type=int, default=settings.REINDEX_UPSERT_BATCH_SIZE)
+    parser.add_argument("--parallel-upserts", type=int, default=settings.REINDEX_PARALLEL_UPSERTS)
+    parser.add_argument("--checkpoint", default=settings.REINDEX_CHECKPOINT_PATH)
+    parser.add_argument("--target", default=None, help="Target collection name (default: <alias>_<timestamp>)")
+    parser.add_argument("--drop-legacy-collection", action="store_true",
+                        help="Allow replacing a real collection named QDRANT_COLLECTION_NAME with the alias")
+    parser.add_argument("--delete-old", action="store_true", help="Delete the previously aliased collection")
+    parser.add_argument("--reset", action="store_true", help="Ignore any existing checkpoint and start a new collection")
+
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        logger.info("Reindex interrupted; rerun to resume from the checkpoint")
@@ -0,0 +1,127 @@
+"""
+Compare VADER with the embedding sentiment head on stored user messages
+
+Optionally distils a new head from VADER labels (--fit) before comparing.
+
+Usage:
+    python -m src.jobs.sentiment_report [--limit N] [--fit] [--output report.json]
+"""
+from sentence_transformers import SentenceTransformer
+from sqlalchemy import select
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import numpy as np
+
+from src.ml_models.sentiment_head import sentiment_head
+from src.models.database import AsyncSessionLocal, engine
+from src.models.models import Conversation
+from src.services.crisis_service import crisis_service
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def fetch_messages(limit: int) -> List[str]:
+    """Most recent user messages"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Conversation.message_text)
+            .where(Conversation.sender == "user")
+            .order_by(Conversation.id.desc())
+            .limit(limit)
+        )
+        return [row[0] for row in result.all()]
+
+
+def _sentiment_bucket(compound: np.ndarray) -> np.ndarray:
+    """VADER's conventional negative/neutral/positive thresholds"""
+    return np.where(compound <= -0.05, -1, np.where(compound >= 0.05, 1, 0))
+
+
+def compare(messages: List[str], embeddings: np.ndarray) -> Dict:
+    """Score with both backends and summarise agreement and cost"""
+    started = time.perf_counter()
+    vader = crisis_service.detect_crisis_batch(messages)
+    vader_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    head_compound = sentiment_head.predict_batch(embeddings)
+    head = crisis_service.detect_crisis_batch(messages, compound=head_compound)
+    head_seconds = time.perf_counter() - started
+
+    count = len(messages)
+    both_crisis = int(np.sum(vader.is_crisis & head.is_crisis))
+
+    return {
+        "messages": count,
+        "compound_mae": float(np.mean(np.abs(vader.compound - head.compound))),
+        "compound_pearson_r": float(np.corrcoef(vader.compound, head.compound)[0, 1]) if count > 1 else None,
+        "sentiment_bucket_agreement": float(np.mean(_sentiment_bucket(vader.compound) == _sentiment_bucket(head.compound))),
+        "crisis_agreement": float(np.mean(vader.is_crisis == head.is_crisis)),
+        "crisis_vader_only": int(np.sum(vader.is_crisis & ~head.is_crisis)),
+        "crisis_head_only": int(np.sum(head.is_crisis & ~vader.is_crisis)),
+        "crisis_both": both_crisis,
+        "vader_ms_per_message": vader_seconds / count * 1000,
+        "head_ms_per_message": head_seconds / count * 1000
+    }
+
+
+async def main(args: argparse.Namespace):
+    """CLI entry point"""
+    try:
+        messages = await fetch_messages(args.limit)
+    finally:
+        await engine.dispose()
+
+    if not messages:
+        logger.warning("⚠️ No user messages to compare")
+        return
+
+    encoder = SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
+    embeddings = encoder.encode(messages, batch_size=args.batch_size, convert_to_numpy=True)
+
+    if args.fit:
+        # Distil VADER onto the embedding space, holding out a slice for the report
+        rng = np.random.default_rng(0)
+        order = rng.permutation(len(messages))
+        split = int(len(messages) * (1 - args.holdout))
+        train, test = order[:split], order[split:]
+
+        targets = crisis_service.detect_crisis_batch([messages[i] for i in train]).compound
+        sentiment_head.fit(embeddings[train], targets, l2=args.l2, embedding_model=settings.EMBEDDING_MODEL_NAME)
+        sentiment_head.save()
+        logger.info(f"✅ Saved sentiment head fitted on {len(train)} messages to {settings.SENTIMENT_HEAD_PATH}")
+
+        messages = [messages[i] for i in test]
+        embeddings = embeddings[test]
+    elif not sentiment_head.load_model():
+        return
+
+    report = compare(messages, embeddings)
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Compare VADER and the embedding sentiment head")
+    parser.add_argument("--limit", type=int, default=5000, help="Number of recent user messages to sample")
+    parser.add_argument("--batch-size", type=int, default=64, help="Encoder batch size")
+    parser.add_argument("--fit", action="store_true", help="Fit and save a new head from VADER labels first")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction held out for the report when fitting")
+    parser.add_argument("--l2", type=float, default=1.0, help="Ridge regularisation strength")
+    parser.add_argument("--output", help="Also write the report to this JSON file")
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,107 @@
+"""
+Sentiment head over sentence-transformer embeddings
+
+A small linear/logistic model that maps the 384-dim all-MiniLM-L6-v2 vector
+(already computed for Qdrant indexing) to a VADER-compatible compound score
+in [-1, 1], so the chat path can score sentiment without a second analyzer pass.
+"""
+import numpy as np
+import logging
+from typing import Optional
+from pathlib import Path
+
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingSentimentHead:
+    """Linear or logistic sentiment model with weights loaded from an .npz file"""
+
+    def __init__(self):
+        self.weights: Optional[np.ndarray] = None
+        self.bias: float = 0.0
+        self.kind: str = "linear"  # 'linear' (clipped regression) or 'logistic'
+        self.embedding_model: Optional[str] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.weights is not None
+
+    def load_model(self, path: Optional[str] = None) -> bool:
+        """Load head weights; returns False (and stays unloaded) if unavailable"""
+        weights_path = Path(path or settings.SENTIMENT_HEAD_PATH)
+        try:
+            if not weights_path.exists():
+                logger.warning(f"⚠️ No sentiment head weights at {weights_path}. Falling back to VADER.")
+                return False
+
+            data = np.load(weights_path, allow_pickle=False)
+            weights = data["weights"].astype(np.float32)
+            if weights.shape != (settings.QDRANT_EMBEDDING_DIM,):
+                raise ValueError(
+                    f"weights shape {weights.shape} does not match embedding dim {settings.QDRANT_EMBEDDING_DIM}"
+                )
+
+            self.weights = weights
+            self.bias = float(data["bias"])
+            self.kind = str(data["kind"]) if "kind" in data else "linear"
+            self.embedding_model = str(data["embedding_model"]) if "embedding_model" in data else None
+
+            logger.info(f"✅ Loaded {self.kind} sentiment head from {weights_path}")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Failed to load sentiment head: {e}")
+            self.weights = None
+            return False
+
+    def save(self, path: Optional[str] = None):
+        """Write head weights to an .npz file"""
+        weights_path = Path(path or settings.SENTIMENT_HEAD_PATH)
+        weights_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            weights_path,
+            weights=self.weights,
+            bias=np.float32(self.bias),
+            kind=self.kind,
+            embedding_model=self.embedding_model or ""
+        )
+
+    def predict_batch(self, embeddings: np.ndarray) -> np.ndarray:
+        """Compound scores in [-1, 1] for a [n, dim] array of embeddings"""
+        if not self.is_loaded:
+            raise RuntimeError("Sentiment head not loaded. Call load_model first.")
+
+        logits = np.asarray(embeddings, dtype=np.float32) @ self.weights + self.bias
+        if self.kind == "logistic":
+            return 2.0 / (1.0 + np.exp(-logits)) - 1.0
+        return np.clip(logits, -1.0, 1.0)
+
+    def predict(self, embedding) -> float:
+        """Compound score in [-1, 1] for a single embedding"""
+        return float(self.predict_batch(np.asarray(embedding, dtype=np.float32)[None, :])[0])
+
+    def fit(self, embeddings: np.ndarray, targets: np.ndarray, l2: float = 1.0, embedding_model: str = ""):
+        """
+        Fit a linear head by ridge regression (closed form), e.g. distilling
+        VADER compound scores onto the embedding space.
+        """
+        x = np.asarray(embeddings, dtype=np.float64)
+        y = np.asarray(targets, dtype=np.float64)
+
+        x_mean = x.mean(axis=0)
+        y_mean = y.mean()
+        xc = x - x_mean
+
+        gram = xc.T @ xc + l2 * np.eye(x.shape[1])
+        weights = np.linalg.solve(gram, xc.T @ (y - y_mean))
+
+        self.weights = weights.astype(np.float32)
+        self.bias = float(y_mean - x_mean @ weights)
+        self.kind = "linear"
+        self.embedding_model = embedding_model
+
+
+# Global instance
+sentiment_head = EmbeddingSentimentHead()
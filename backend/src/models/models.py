@@ -95,7 +95,7 @@ class Conversation(Base):
     __tablename__ = "conversations"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     session_id = Column(String(50), index=True)
     
     message_text = Column(Text, nullable=False)
@@ -108,18 +108,55 @@ class Conversation(Base):
     # Vector embedding ID in Qdrant
     vector_id = Column(String(50))
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
     # Relationships
     user = relationship("User", back_populates="conversations")
 
 
+class VectorOutbox(Base):
+    """Pending Qdrant indexing work, written in the same transaction as its conversation"""
+    __tablename__ = "vector_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(
+        Integer,
+        ForeignKey("conversations.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True
+    )
+    
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    claimed_until = Column(DateTime(timezone=True))  # Lease held by an indexer while it upserts
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class DeletionJob(Base):
+    """Background deletion of a user's chat history"""
+    __tablename__ = "deletion_jobs"
+    
+    id = Column(String(36), primary_key=True)  # uuid4, returned to the client
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    scope = Column(String(20), nullable=False)  # 'user_history'
+    
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, completed, failed
+    conversations_deleted = Column(Integer, default=0)
+    sessions_deleted = Column(Integer, default=0)
+    error = Column(Text)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+
 class CrisisLog(Base):
     """Crisis detection log model"""
     __tablename__ = "crisis_logs"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    event_id = Column(String(36), unique=True, index=True)  # Client-generated; makes spill replay idempotent
     
     message_text = Column(Text, nullable=False)
     crisis_score = Column(Integer, nullable=False)
@@ -128,7 +165,7 @@ class CrisisLog(Base):
     action_taken = Column(String(50))  # 'guardian_alerted', 'resource_provided', etc.
     resolved = Column(Boolean, default=False)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
     # Relationships
     user = relationship("User", back_populates="crisis_logs")
@@ -145,6 +182,7 @@ class GuardianAlert(Base):
     guardian_contact = Column(String(20), nullable=False)
     alert_sent = Column(Boolean, default=False)
     alert_method = Column(String(20))  # 'whatsapp', 'sms', 'email'
+    status = Column(String(20), default="sent", index=True)  # 'sent', 'failed', 'pending' (resent on next start)
     
     message_sent = Column(Text)
     response_received = Column(Text)
@@ -0,0 +1,50 @@
+"""
+Idempotent schema upgrades for existing databases
+
+Base.metadata.create_all only creates missing tables; it never adds columns or
+indexes to tables that already exist. Each statement here brings an older
+database up to the current models and is a no-op on a new one. They run at
+startup after create_all, on an autocommit connection (so indexes can be built
+CONCURRENTLY without blocking writes), under an advisory lock so only one
+worker applies them at a time.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+import logging
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_lock key shared by every worker
+ADVISORY_LOCK_KEY = 0x4E57_5343_4845  # "NWSCHE"
+
+SCHEMA_UPGRADES = [
+    # guardian_alerts.status: pending alerts are resent on the next start
+    "ALTER TABLE guardian_alerts ADD COLUMN IF NOT EXISTS status VARCHAR(20) DEFAULT 'sent'",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_guardian_alerts_status ON guardian_alerts (status)",
+    # vector_outbox.claimed_until: indexer leases instead of row locks held across the upsert
+    "ALTER TABLE vector_outbox ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMPTZ",
+    # crisis_logs.event_id: replayed spill rows that already reached the database are skipped
+    "ALTER TABLE crisis_logs ADD COLUMN IF NOT EXISTS event_id VARCHAR(36)",
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_crisis_logs_event_id ON crisis_logs (event_id)",
+    # Keyset deletes by the retention sweeper and account deletion jobs
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_conversations_user_id ON conversations (user_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_conversations_created_at ON conversations (created_at)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_crisis_logs_user_id ON crisis_logs (user_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_crisis_logs_created_at ON crisis_logs (created_at)",
+]
+
+
+async def apply_schema_upgrades(engine: AsyncEngine):
+    """Run every upgrade statement; failures are logged and the rest still run"""
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        try:
+            for statement in SCHEMA_UPGRADES:
+                try:
+                    await conn.execute(text(statement))
+                except Exception as e:
+                    logger.error(f"❌ Schema upgrade failed: {statement}: {e}")
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+    logger.info(f"✅ Schema upgrades checked ({len(SCHEMA_UPGRADES)} statements)")
@@ -0,0 +1,214 @@
+"""
+Chat history deletion across Postgres and Qdrant
+
+Deletes are set-based: one DELETE ... WHERE per session, or chunked
+DELETE ... WHERE id IN (SELECT ... LIMIT n) statements for a whole account, each
+in its own short transaction. Qdrant points go with one filtered delete per
+session or user, issued after the rows (and their outbox entries) are gone so
+the vector indexer cannot re-add them.
+
+Account-wide deletes run as background jobs recorded in deletion_jobs; jobs
+interrupted by a restart are resumed on startup. Every worker tries to resume
+them, so each job runs under a per-job Postgres advisory lock and only the
+worker holding it does the work.
+"""
+from sqlalchemy import select, update, delete, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set
+import asyncio
+import logging
+import uuid
+
+from src.models.database import AsyncSessionLocal, engine
+from src.models.models import Conversation, ChatSession, DeletionJob
+from src.services.qdrant_service import qdrant_service
+from src.services.session_context import session_context_cache
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# First key of the two-key advisory lock; the second is hashtext(job_id)
+ADVISORY_LOCK_NAMESPACE = 0x4E57_4445  # "NWDE"
+
+
+class ChatDeletionService:
+    """Session deletes inline, account deletes as resumable background jobs"""
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+        self._metrics = {
+            "sessions_deleted": 0,
+            "jobs_completed": 0,
+            "jobs_failed": 0,
+            "jobs_skipped_locked": 0,
+            "conversations_deleted": 0
+        }
+
+    async def start(self):
+        """Resume jobs left queued or running by a previous process"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(DeletionJob.id).where(DeletionJob.status.in_(["queued", "running"]))
+            )
+            job_ids = result.scalars().all()
+
+        for job_id in job_ids:
+            self._spawn(job_id)
+        if job_ids:
+            logger.info(f"✅ Resumed {len(job_ids)} chat deletion jobs")
+
+    async def stop(self):
+        """Cancel running jobs; they stay in deletion_jobs and resume on next start"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def delete_session(self, db: AsyncSession, user_id: int, session_id: str) -> int:
+        """Delete one session's rows and points; returns conversations deleted"""
+        result = await db.execute(
+            delete(Conversation)
+            .where(Conversation.session_id == session_id)
+            .where(Conversation.user_id == user_id)
+        )
+        await db.execute(
+            delete(ChatSession)
+            .where(ChatSession.session_id == session_id)
+            .where(ChatSession.user_id == user_id)
+        )
+        await db.commit()
+
+        session_context_cache.invalidate(user_id, [session_id])
+        self._metrics["sessions_deleted"] += 1
+        self._metrics["conversations_deleted"] += result.rowcount
+
+        try:
+            await qdrant_service.delete_session_conversations(user_id, session_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Qdrant points for session {session_id} were not deleted: {e}")
+
+        return result.rowcount
+
+    async def submit_user_history(self, user_id: int) -> str:
+        """Record a job to delete all of a user's chat history and start it"""
+        job_id = str(uuid.uuid4())
+        async with AsyncSessionLocal() as db:
+            db.add(DeletionJob(id=job_id, user_id=user_id, scope="user_history", status="queued"))
+            await db.commit()
+
+        self._spawn(job_id)
+        return job_id
+
+    async def get_job(self, db: AsyncSession, user_id: int, job_id: str) -> Optional[DeletionJob]:
+        """A user's own deletion job"""
+        result = await db.execute(
+            select(DeletionJob)
+            .where(DeletionJob.id == job_id)
+            .where(DeletionJob.user_id == user_id)
+        )
+        return result.scalar_one_or_none()
+
+    def _spawn(self, job_id: str):
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job_id: str):
+        """Run a job if no other worker holds its lock"""
+        lock_args = {"namespace": ADVISORY_LOCK_NAMESPACE, "job_id": job_id}
+        async with engine.connect() as lock_conn:
+            locked = await lock_conn.scalar(
+                text("SELECT pg_try_advisory_lock(:namespace, hashtext(:job_id))"), lock_args
+            )
+            await lock_conn.commit()
+            if not locked:
+                self._metrics["jobs_skipped_locked"] += 1
+                return
+
+            try:
+                await self._process(job_id)
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:namespace, hashtext(:job_id))"), lock_args)
+                await lock_conn.commit()
+
+    async def _process(self, job_id: str):
+        """Delete in chunks with pauses, then sessions, then Qdrant points"""
+        async with AsyncSessionLocal() as db:
+            job = await db.get(DeletionJob, job_id)
+            # Another worker may have finished it before this one got the lock
+            if job is None or job.status not in ("queued", "running"):
+                return
+            user_id = job.user_id
+            job.status = "running"
+            await db.commit()
+
+        try:
+            while True:
+                async with AsyncSessionLocal() as db:
+                    chunk = (
+                        select(Conversation.id)
+                        .where(Conversation.user_id == user_id)
+                        .order_by(Conversation.id)
+                        .limit(settings.DELETION_CHUNK_SIZE)
+                        .scalar_subquery()
+                    )
+                    result = await db.execute(delete(Conversation).where(Conversation.id.in_(chunk)))
+                    deleted = result.rowcount
+                    await db.execute(
+                        update(DeletionJob)
+                        .where(DeletionJob.id == job_id)
+                        .values(conversations_deleted=DeletionJob.conversations_deleted + deleted)
+                    )
+                    await db.commit()
+
+                self._metrics["conversations_deleted"] += deleted
+                if deleted < settings.DELETION_CHUNK_SIZE:
+                    break
+                await asyncio.sleep(settings.DELETION_CHUNK_PAUSE_SECONDS)
+
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    delete(ChatSession)
+                    .where(ChatSession.user_id == user_id)
+                    .returning(ChatSession.session_id)
+                )
+                session_ids = result.scalars().all()
+                await db.execute(
+                    update(DeletionJob)
+                    .where(DeletionJob.id == job_id)
+                    .values(sessions_deleted=len(session_ids))
+                )
+                await db.commit()
+
+            session_context_cache.invalidate(user_id, session_ids)
+            await qdrant_service.delete_user_conversations(user_id)
+
+            await self._finish(job_id, "completed")
+            self._metrics["jobs_completed"] += 1
+            logger.info(f"✅ Chat history deletion {job_id} for user {user_id} completed")
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._metrics["jobs_failed"] += 1
+            logger.error(f"❌ Chat history deletion {job_id} failed: {e}")
+            await self._finish(job_id, "failed", error=str(e)[:500])
+
+    @staticmethod
+    async def _finish(job_id: str, status: str, error: Optional[str] = None):
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(DeletionJob)
+                .where(DeletionJob.id == job_id)
+                .values(status=status, error=error, finished_at=datetime.now(timezone.utc))
+            )
+            await db.commit()
+
+    def stats(self) -> Dict:
+        """Deletion counters"""
+        return {"running_jobs": len(self._tasks), **self._metrics}
+
+
+# Global instance
+chat_deletion_service = ChatDeletionService()
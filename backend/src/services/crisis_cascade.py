@@ -0,0 +1,137 @@
+"""
+Two-stage crisis cascade
+
+Stage one is the keyword/sentiment scorer in CrisisService, which settles the
+clear cases. Only messages whose stage-one score lands in the borderline band
+[CRISIS_BORDERLINE_LOW, CRISIS_BORDERLINE_HIGH) and were not already flagged
+are escalated to a zero-shot LLM classifier, under its own concurrency cap.
+The classifier takes an urgent llm_scheduler slot like any other generation,
+and the whole escalation (queue wait included) is bounded by
+CRISIS_ESCALATION_TIMEOUT_SECONDS; on timeout or rejection the stage-one
+result stands. Off by default (CRISIS_CASCADE_ENABLED).
+"""
+from typing import Dict, Optional, Sequence
+import asyncio
+import logging
+
+from src.services.crisis_service import crisis_service
+from src.services.llm_scheduler import llm_scheduler, SchedulerRejected, PRIORITY_URGENT
+from src.services.ollama_client import ollama_client
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+ESCALATION_PROMPT = (
+    "You are a safety classifier for a mental health support chat. "
+    "Decide whether the user message below indicates a risk of suicide, self-harm "
+    "or an acute mental health crisis. Answer with exactly one word: CRISIS or SAFE.\n\n"
+    "Message: \"{message}\"\n\nAnswer:"
+)
+
+
+class CrisisCascade:
+    """Cheap screen first, expensive classifier only on borderline scores"""
+
+    def __init__(self):
+        self._slots = asyncio.Semaphore(settings.CRISIS_ESCALATION_CONCURRENCY)
+        self._metrics = {
+            "screened": 0,
+            "escalated": 0,
+            "escalation_positive": 0,
+            "escalation_timeouts": 0,
+            "escalation_rejected": 0,
+            "escalation_errors": 0
+        }
+
+    def is_borderline(self, result: Dict) -> bool:
+        """Whether a stage-one result should be escalated"""
+        if result.get("is_crisis"):
+            return False
+        score = result.get("score", 0)
+        return settings.CRISIS_BORDERLINE_LOW <= score < settings.CRISIS_BORDERLINE_HIGH
+
+    async def assess(self, message: str, embedding: Optional[Sequence[float]] = None) -> Dict:
+        """
+        Run the cascade for one message.
+        Returns the stage-one result dict, with "escalated" and (when escalated)
+        "second_stage" keys added; a positive second stage sets is_crisis.
+        """
+        result = await crisis_service.detect_crisis_async(message, embedding=embedding)
+        self._metrics["screened"] += 1
+        result["escalated"] = False
+
+        if not settings.CRISIS_CASCADE_ENABLED or not self.is_borderline(result):
+            return result
+
+        self._metrics["escalated"] += 1
+        result["escalated"] = True
+
+        verdict = await self._second_stage(message)
+        result["second_stage"] = verdict
+
+        if verdict == "crisis":
+            self._metrics["escalation_positive"] += 1
+            result["is_crisis"] = True
+            result["resources"] = crisis_service.resources
+            logger.warning(f"⚠️ Borderline message (score {result.get('score')}) escalated to crisis by second stage")
+
+        return result
+
+    async def _second_stage(self, message: str) -> str:
+        """Zero-shot LLM classification: 'crisis', 'safe' or 'unavailable'"""
+        try:
+            return await asyncio.wait_for(
+                self._classify(message),
+                timeout=settings.CRISIS_ESCALATION_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            self._metrics["escalation_timeouts"] += 1
+            logger.warning("⚠️ Crisis second stage timed out; keeping stage-one result")
+            return "unavailable"
+        except SchedulerRejected as e:
+            self._metrics["escalation_rejected"] += 1
+            logger.warning(f"⚠️ Crisis second stage not admitted ({e.reason}); keeping stage-one result")
+            return "unavailable"
+        except Exception as e:
+            self._metrics["escalation_errors"] += 1
+            logger.error(f"❌ Crisis second stage failed: {e}")
+            return "unavailable"
+
+    async def _classify(self, message: str) -> str:
+        """Ask the LLM for a one-word verdict, waiting for a concurrency slot and a scheduler slot"""
+        async with self._slots:
+            granted_at = await llm_scheduler.acquire(PRIORITY_URGENT)
+            try:
+                response = await ollama_client.generate(
+                    {
+                        "model": settings.CRISIS_ESCALATION_MODEL or settings.OLLAMA_MODEL,
+                        "prompt": ESCALATION_PROMPT.format(message=message.replace('"', "'")),
+                        "stream": False,
+                        "options": {
+                            "temperature": 0.0,
+                            "num_predict": 4,
+                        }
+                    },
+                    timeout=settings.CRISIS_ESCALATION_TIMEOUT_SECONDS
+                )
+            finally:
+                llm_scheduler.release(granted_at)
+
+        response.raise_for_status()
+        answer = response.json().get("response", "").strip().upper()
+        return "crisis" if answer.startswith("CRISIS") else "safe"
+
+    def stats(self) -> Dict:
+        """Escalation counters and the fraction of traffic escalated"""
+        screened = self._metrics["screened"]
+        return {
+            "enabled": settings.CRISIS_CASCADE_ENABLED,
+            "borderline_band": [settings.CRISIS_BORDERLINE_LOW, settings.CRISIS_BORDERLINE_HIGH],
+            "concurrency": settings.CRISIS_ESCALATION_CONCURRENCY,
+            **self._metrics,
+            "escalated_fraction": self._metrics["escalated"] / screened if screened else 0.0
+        }
+
+
+# Global instance
+crisis_cascade = CrisisCascade()
@@ -0,0 +1,254 @@
+"""
+Write-behind writer for CrisisLog rows
+
+Crisis detections are queued in-process and a background task flushes them as
+multi-row INSERTs when a batch fills up or the flush interval elapses, so the
+chat request never waits on a database round trip for logging. Rows that can't
+be written (queue overflow, database down at shutdown) are appended to a JSONL
+spill file and replayed on the next start. Each event carries a client-generated
+event_id and inserts skip ids already present, so a batch whose commit landed
+just before its flush was cancelled is not inserted twice on replay.
+"""
+from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+from src.models.database import AsyncSessionLocal
+from src.models.models import CrisisLog
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CrisisLogWriter:
+    """Batches crisis events into CrisisLog inserts off the request path"""
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._batch: List[Dict] = []  # Rows taken off the queue but not yet written
+        self.spill_path = Path(settings.CRISIS_LOG_SPILL_PATH)
+        self.corrupt_path = self.spill_path.with_name(self.spill_path.name + ".corrupt")
+        self._metrics = {
+            "enqueued": 0,
+            "written": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "duplicates_skipped": 0,
+            "corrupt_spill_lines": 0
+        }
+
+    def submit(
+        self,
+        user_id: int,
+        message_text: str,
+        crisis_score: float,
+        keywords_detected: List[str],
+        action_taken: str = "resource_provided"
+    ):
+        """Queue a crisis event; never blocks and never touches the database"""
+        row = {
+            "event_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "message_text": message_text,
+            "crisis_score": int(crisis_score),
+            "keywords_detected": json.dumps(keywords_detected),
+            "action_taken": action_taken,
+            "created_at": datetime.now(timezone.utc)
+        }
+
+        if self._queue is None:
+            self._spill([row])
+            return
+
+        try:
+            self._queue.put_nowait(row)
+            self._metrics["enqueued"] += 1
+        except asyncio.QueueFull:
+            logger.warning("⚠️ Crisis log queue full; spilling event to disk")
+            self._spill([row])
+
+    async def start(self):
+        """Replay spilled rows and start the flush task"""
+        self._queue = asyncio.Queue(maxsize=settings.CRISIS_LOG_QUEUE_SIZE)
+        self._stopping = asyncio.Event()
+        await self._replay_spill()
+        self._task = asyncio.create_task(self._run())
+        logger.info("✅ Crisis log writer started")
+
+    async def stop(self):
+        """Flush everything still queued; spill to disk if the database is unavailable"""
+        if self._task is None:
+            return
+
+        # Sentinel tells the flush task to write its current batch and exit; a full
+        # queue has no room for it, so the task also exits once it has drained
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+        timed_out = False
+        try:
+            await asyncio.wait_for(self._task, timeout=settings.CRISIS_LOG_STOP_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            timed_out = True
+            logger.warning("⚠️ Crisis log writer did not finish in time; spilling remaining events")
+        self._task = None
+
+        # The batch a cancelled flush was writing, then whatever is still queued
+        remaining, self._batch = self._batch, []
+        while not self._queue.empty():
+            row = self._queue.get_nowait()
+            if row is not None:
+                remaining.append(row)
+
+        # After a timeout the database is not answering; don't wait on it again
+        if remaining and (timed_out or not await self._flush(remaining)):
+            self._spill(remaining)
+
+        self._queue = None
+        logger.info("✅ Crisis log writer stopped")
+
+    async def _run(self):
+        """Collect events into batches bounded by size and time"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            if self._stopping.is_set() and self._queue.empty():
+                return
+            row = await self._queue.get()
+            if row is None:
+                return
+
+            # Kept on self so stop() can spill it if this task is cancelled mid-flush
+            batch = self._batch = [row]
+            deadline = loop.time() + settings.CRISIS_LOG_FLUSH_INTERVAL_SECONDS
+
+            while len(batch) < settings.CRISIS_LOG_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            if not await self._flush(batch):
+                self._spill(batch)
+            self._batch = []
+
+    async def _flush(self, rows: List[Dict]) -> bool:
+        """Write rows with one multi-row INSERT, skipping event ids already written; returns False on failure"""
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    insert(CrisisLog).values(rows).on_conflict_do_nothing(index_elements=["event_id"])
+                )
+                await db.commit()
+
+            self._metrics["flushes"] += 1
+            self._metrics["written"] += result.rowcount
+            self._metrics["duplicates_skipped"] += len(rows) - result.rowcount
+            return True
+
+        except Exception as e:
+            self._metrics["failed_flushes"] += 1
+            logger.error(f"❌ Failed to write {len(rows)} crisis logs: {e}")
+            return False
+
+    @staticmethod
+    def _spill_line(row: Dict) -> str:
+        return json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n"
+
+    def _spill(self, rows: List[Dict]):
+        """Append rows to the durable JSONL spill file"""
+        try:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.spill_path, 'a') as f:
+                for row in rows:
+                    f.write(self._spill_line(row))
+                f.flush()
+            self._metrics["spilled"] += len(rows)
+        except Exception as e:
+            logger.error(f"❌ Failed to spill {len(rows)} crisis logs to {self.spill_path}: {e}")
+
+    def _rewrite_spill(self, rows: List[Dict]):
+        """Replace the spill file with rows still to be written"""
+        tmp_path = self.spill_path.with_name(self.spill_path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            for row in rows:
+                f.write(self._spill_line(row))
+            f.flush()
+        os.replace(tmp_path, self.spill_path)
+
+    def _read_spill(self) -> List[Dict]:
+        """Parse the spill file; lines that don't parse (a torn final write) go to the .corrupt file"""
+        rows, corrupt = [], []
+        with open(self.spill_path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    row["created_at"] = datetime.fromisoformat(row["created_at"])
+                    row.setdefault("event_id", str(uuid.uuid4()))  # Spilled before event ids existed
+                    rows.append(row)
+                except (ValueError, TypeError, KeyError) as e:
+                    corrupt.append(line if line.endswith("\n") else line + "\n")
+                    logger.error(f"❌ Skipping corrupt line in {self.spill_path}: {e}")
+
+        if corrupt:
+            self._metrics["corrupt_spill_lines"] += len(corrupt)
+            with open(self.corrupt_path, 'a') as f:
+                f.writelines(corrupt)
+        return rows
+
+    async def _replay_spill(self):
+        """Insert rows left in the spill file by a previous run"""
+        if not self.spill_path.exists():
+            return
+
+        rows = self._read_spill()
+
+        batch_size = settings.CRISIS_LOG_BATCH_SIZE
+        for start in range(0, len(rows), batch_size):
+            if not await self._flush(rows[start:start + batch_size]):
+                # Keep only what hasn't been written yet
+                try:
+                    self._rewrite_spill(rows[start:])
+                except Exception as e:
+                    logger.error(f"❌ Failed to rewrite {self.spill_path}: {e}")
+                self._metrics["replayed"] += start
+                return
+
+        self.spill_path.unlink()
+        self._metrics["replayed"] += len(rows)
+        if rows:
+            logger.info(f"✅ Replayed {len(rows)} spilled crisis logs")
+
+    def stats(self) -> Dict:
+        """Queue depth and write counters"""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            **self._metrics
+        }
+
+
+# Global instance
+crisis_log_writer = CrisisLogWriter()
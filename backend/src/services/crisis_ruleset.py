@@ -0,0 +1,133 @@
+"""
+Immutable, versioned crisis ruleset (keywords + resources)
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import time
+
+from src.services.keyword_matcher import KeywordMatcher
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Repository root (…/backend/src/services/crisis_ruleset.py -> …/)
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+
+DEFAULT_KEYWORDS = {
+    "suicide": ["suicide", "kill myself", "end my life", "want to die"],
+    "self_harm": ["cut myself", "hurt myself", "self-harm"],
+    "severe_depression": ["can't go on", "no point", "worthless", "hopeless"]
+}
+
+DEFAULT_RESOURCES = [
+    {
+        "name": "National Suicide Prevention Lifeline",
+        "contact": "988",
+        "type": "hotline"
+    },
+    {
+        "name": "Crisis Text Line",
+        "contact": "Text HOME to 741741",
+        "type": "text"
+    }
+]
+
+
+def resolve_data_path(path: str) -> Path:
+    """
+    Resolve a data file path independently of the process working directory.
+    Relative paths are tried against the cwd first, then the repository root.
+    """
+    candidate = Path(path)
+    if candidate.is_absolute():
+        return candidate
+
+    for base in (Path.cwd(), PROJECT_ROOT):
+        if (base / candidate).exists():
+            return (base / candidate).resolve()
+
+    return (PROJECT_ROOT / candidate).resolve()
+
+
+def _file_mtime(path: Path) -> Optional[float]:
+    """Modification time, or None when the file does not exist"""
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+@dataclass(frozen=True)
+class CrisisRuleset:
+    """
+    A compiled ruleset. Instances are never mutated; a reload builds a new one
+    and the service swaps the reference, so in-flight requests keep scoring
+    against the version they started with.
+    """
+    version: str
+    crisis_keywords: Dict[str, List[str]] = field(repr=False)
+    keyword_matcher: KeywordMatcher = field(repr=False)
+    resources: List[Dict] = field(repr=False)
+    source_mtimes: Tuple[Optional[float], Optional[float]] = field(repr=False)
+    loaded_at: float = field(default_factory=time.time)
+
+    @property
+    def keyword_count(self) -> int:
+        return len(self.keyword_matcher)
+
+    @staticmethod
+    def source_paths() -> Tuple[Path, Path]:
+        """Keyword and resource file locations"""
+        return (
+            resolve_data_path(settings.CRISIS_RULES_PATH),
+            resolve_data_path(settings.CRISIS_RESOURCES_PATH)
+        )
+
+    @classmethod
+    def current_mtimes(cls) -> Tuple[Optional[float], Optional[float]]:
+        """Modification times of the source files as they are on disk now"""
+        rules_path, resources_path = cls.source_paths()
+        return _file_mtime(rules_path), _file_mtime(resources_path)
+
+    @classmethod
+    def load(cls, strict: bool = False) -> "CrisisRuleset":
+        """
+        Read and compile the ruleset.
+        With strict=False, unreadable files fall back to defaults / empty lists
+        (startup behaviour); with strict=True errors propagate so a bad edit
+        never replaces a working ruleset.
+        """
+        rules_path, resources_path = cls.source_paths()
+        crisis_keywords = cls._load_json_section(rules_path, "crisis_keywords", DEFAULT_KEYWORDS, {}, strict)
+        resources = cls._load_json_section(resources_path, "crisis_resources", DEFAULT_RESOURCES, [], strict)
+
+        payload = json.dumps({"keywords": crisis_keywords, "resources": resources}, sort_keys=True)
+        version = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+        return cls(
+            version=version,
+            crisis_keywords=crisis_keywords,
+            keyword_matcher=KeywordMatcher(crisis_keywords),
+            resources=resources,
+            source_mtimes=(_file_mtime(rules_path), _file_mtime(resources_path))
+        )
+
+    @staticmethod
+    def _load_json_section(path: Path, key: str, default, empty, strict: bool):
+        """Load one top-level section of a JSON data file"""
+        try:
+            if path.exists():
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                    return data.get(key, empty)
+            else:
+                return default
+        except Exception as e:
+            if strict:
+                raise
+            logger.error(f"Failed to load {key} from {path}: {e}")
+            return empty
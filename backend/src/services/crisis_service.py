@@ -2,110 +2,271 @@
 Crisis detection service
 """
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-import json
-from pathlib import Path
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import copy
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
 import logging
 
+from src.ml_models.sentiment_head import sentiment_head
+from src.services.crisis_ruleset import CrisisRuleset
+from src.services.keyword_matcher import KeywordMatch, KeywordMatcher, normalize_text
+from src.utils.cache import TTLCache
+from src.utils.config import settings
+
 logger = logging.getLogger(__name__)
 
+# Messages per VADER/keyword chunk in detect_crisis_batch
+BATCH_CHUNK_SIZE = 1000
+
+
+@dataclass
+class CrisisBatchResult:
+    """
+    Columnar crisis scores for a batch of messages.
+    Detected keyword ids for message i are keyword_ids[keyword_offsets[i]:keyword_offsets[i + 1]].
+    """
+    is_crisis: np.ndarray  # bool, one per message
+    scores: np.ndarray  # float32 crisis score, one per message
+    compound: np.ndarray  # float32 VADER compound sentiment, one per message
+    keyword_ids: np.ndarray  # int32, flattened detected keyword ids
+    keyword_offsets: np.ndarray  # int64, len(messages) + 1
+    keywords: List[str] = field(repr=False)  # keyword id -> phrase
+    
+    def __len__(self) -> int:
+        return len(self.is_crisis)
+    
+    def keywords_for(self, index: int) -> List[str]:
+        """Detected keyword phrases for one message"""
+        start, end = self.keyword_offsets[index], self.keyword_offsets[index + 1]
+        return [self.keywords[keyword_id] for keyword_id in self.keyword_ids[start:end]]
+
 
 class CrisisService:
     """Service for detecting crisis situations in messages"""
     
     def __init__(self):
         self.analyzer = SentimentIntensityAnalyzer()
-        self.crisis_keywords = self._load_crisis_keywords()
-        self.resources = self._load_resources()
+        
+        # Immutable compiled ruleset, replaced wholesale on reload
+        self._ruleset = CrisisRuleset.load()
+        self._reload_lock = threading.Lock()
+        self._watcher_task = None
+        
+        # Memoized results for repeated messages, keyed on text hash + ruleset version
+        self.result_cache = TTLCache(
+            max_entries=settings.CRISIS_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.CRISIS_CACHE_TTL_SECONDS
+        )
+        
+        # Dedicated, size-limited pool so scoring never runs on the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.CRISIS_EXECUTOR_WORKERS,
+            thread_name_prefix="crisis-scoring"
+        )
+        self._executor_slots = asyncio.Semaphore(settings.CRISIS_EXECUTOR_MAX_PENDING)
+        self._metrics_lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._metrics = {
+            "inline": 0,
+            "offloaded": 0,
+            "max_queue_depth": 0,
+            "queue_wait_seconds_total": 0.0,
+            "run_seconds_total": 0.0
+        }
     
-    def _load_crisis_keywords(self) -> Dict:
-        """Load crisis detection keywords"""
-        try:
-            crisis_config_path = Path("data/crisis_detection.json")
-            if crisis_config_path.exists():
-                with open(crisis_config_path, 'r') as f:
-                    data = json.load(f)
-                    return data.get("crisis_keywords", {})
-            else:
-                # Default keywords
-                return {
-                    "suicide": ["suicide", "kill myself", "end my life", "want to die"],
-                    "self_harm": ["cut myself", "hurt myself", "self-harm"],
-                    "severe_depression": ["can't go on", "no point", "worthless", "hopeless"]
-                }
-        except Exception as e:
-            logger.error(f"Failed to load crisis keywords: {e}")
-            return {}
-    
-    def _load_resources(self) -> List[Dict]:
-        """Load mental health resources"""
-        try:
-            resources_path = Path("data/mental_health_resources.json")
-            if resources_path.exists():
-                with open(resources_path, 'r') as f:
-                    data = json.load(f)
-                    return data.get("crisis_resources", [])
+    @property
+    def ruleset(self) -> CrisisRuleset:
+        """The ruleset currently used for new requests"""
+        return self._ruleset
+    
+    @property
+    def crisis_keywords(self) -> Dict[str, List[str]]:
+        return self._ruleset.crisis_keywords
+    
+    @property
+    def keyword_matcher(self) -> KeywordMatcher:
+        return self._ruleset.keyword_matcher
+    
+    @property
+    def resources(self) -> List[Dict]:
+        return self._ruleset.resources
+    
+    @property
+    def ruleset_version(self) -> str:
+        return self._ruleset.version
+    
+    def reload_ruleset(self, force: bool = False) -> bool:
+        """
+        Rebuild the ruleset from disk and swap it in atomically.
+        Returns True when a new version was installed. A ruleset that fails to
+        load raises and leaves the current one in place.
+        """
+        with self._reload_lock:
+            current = self._ruleset
+            if not force and CrisisRuleset.current_mtimes() == current.source_mtimes:
+                return False
+            
+            ruleset = CrisisRuleset.load(strict=True)
+            if ruleset.version == current.version:
+                # Files touched but content unchanged; remember the new mtimes
+                self._ruleset = ruleset
+                return False
+            
+            # Single reference assignment: requests already running keep their snapshot
+            self._ruleset = ruleset
+            self.result_cache.clear()
+        
+        logger.info(
+            f"✅ Crisis ruleset {current.version} -> {ruleset.version} "
+            f"({ruleset.keyword_count} phrases, {len(ruleset.resources)} resources)"
+        )
+        return True
+    
+    async def reload_ruleset_async(self, force: bool = False) -> bool:
+        """Rebuild the ruleset on a worker thread"""
+        return await asyncio.to_thread(self.reload_ruleset, force)
+    
+    async def _watch_ruleset(self, interval: float):
+        """Poll the ruleset files and reload when they change"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_ruleset_async()
+            except Exception as e:
+                logger.error(f"❌ Crisis ruleset reload failed, keeping version {self.ruleset_version}: {e}")
+    
+    def start_watcher(self):
+        """Start the background ruleset file watcher (if enabled)"""
+        interval = settings.CRISIS_RULES_RELOAD_INTERVAL_SECONDS
+        if interval > 0 and self._watcher_task is None:
+            self._watcher_task = asyncio.create_task(self._watch_ruleset(interval))
+            logger.info(f"✅ Watching crisis ruleset files every {interval}s")
+    
+    async def stop_watcher(self):
+        """Stop the ruleset file watcher"""
+        if self._watcher_task is not None:
+            self._watcher_task.cancel()
+            try:
+                await self._watcher_task
+            except asyncio.CancelledError:
+                pass
+            self._watcher_task = None
+    
+    @property
+    def uses_embedding_sentiment(self) -> bool:
+        """True when sentiment comes from the embedding head instead of VADER"""
+        return settings.CRISIS_SENTIMENT_BACKEND == "embedding" and sentiment_head.is_loaded
+    
+    def _sentiment_backend(self, embedding) -> str:
+        """Which sentiment model scores this message"""
+        return "embedding" if embedding is not None and self.uses_embedding_sentiment else "vader"
+    
+    @staticmethod
+    def _cache_key(message: str, ruleset: CrisisRuleset, backend: str) -> Tuple[str, str, bytes]:
+        """
+        Cache key for a message. Only whitespace is normalized: VADER is
+        case- and punctuation-sensitive, so those stay part of the key.
+        """
+        text = ' '.join(message.split())
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        return ruleset.version, backend, digest
+    
+    @staticmethod
+    def _score_keywords(
+        matches: List[KeywordMatch],
+        ruleset: CrisisRuleset
+    ) -> Tuple[float, List[KeywordMatch], bool]:
+        """
+        Score keyword matches, counting each category once
+        Returns: (keyword score, representative match per category, high severity flag)
+        """
+        best_matches = ruleset.keyword_matcher.first_match_per_category(matches)
+        
+        crisis_score = 0
+        detected = []
+        high_severity_detected = False
+        
+        for category in ruleset.crisis_keywords:
+            match = best_matches.get(category)
+            if match is None:
+                continue
+            
+            # Only count once per category
+            if category == "high_severity":
+                crisis_score += 3  # High severity gets more weight
+                high_severity_detected = True
+            elif category == "medium_severity":
+                crisis_score += 2
             else:
-                # Default resources
-                return [
-                    {
-                        "name": "National Suicide Prevention Lifeline",
-                        "contact": "988",
-                        "type": "hotline"
-                    },
-                    {
-                        "name": "Crisis Text Line",
-                        "contact": "Text HOME to 741741",
-                        "type": "text"
-                    }
-                ]
-        except Exception as e:
-            logger.error(f"Failed to load resources: {e}")
-            return []
-    
-    def detect_crisis(self, message: str) -> Dict:
+                crisis_score += 1
+            
+            detected.append(match)
+        
+        return crisis_score, detected, high_severity_detected
+    
+    @staticmethod
+    def _sentiment_adjustment(compound: float) -> float:
+        """Very negative sentiment increases crisis score"""
+        if compound < -0.7:
+            return 1
+        elif compound < -0.5:
+            return 0.5
+        return 0
+    
+    def detect_crisis(self, message: str, embedding: Optional[Sequence[float]] = None) -> Dict:
         """
         Detect crisis in message
+        If an embedding of the message is passed and CRISIS_SENTIMENT_BACKEND is
+        'embedding', sentiment is scored by the embedding head instead of VADER.
         Returns: {
             "is_crisis": bool,
             "score": int (0-5),
             "keywords_detected": List[str],
+            "keyword_matches": List[Dict] (keyword, category, offsets),
             "resources": List[Dict]
         }
         """
-        message_lower = message.lower().strip()
+        # Snapshot the ruleset so a concurrent reload can't mix versions
+        ruleset = self._ruleset
         
-        # Remove extra spaces and normalize
-        message_normalized = ' '.join(message_lower.split())
+        backend = self._sentiment_backend(embedding)
         
-        # Check for crisis keywords
-        crisis_score = 0
-        detected_keywords = []
-        high_severity_detected = False
+        cache_key = self._cache_key(message, ruleset, backend)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
         
-        for category, keywords in self.crisis_keywords.items():
-            for keyword in keywords:
-                # Check both original and normalized message
-                if keyword in message_lower or keyword in message_normalized:
-                    if category == "high_severity":
-                        crisis_score += 3  # High severity gets more weight
-                        high_severity_detected = True
-                    elif category == "medium_severity":
-                        crisis_score += 2
-                    else:
-                        crisis_score += 1
-                    
-                    detected_keywords.append(keyword)
-                    break  # Only count once per category
-        
-        # Sentiment analysis
-        sentiment = self.analyzer.polarity_scores(message)
-        
-        # Very negative sentiment increases crisis score
-        if sentiment['compound'] < -0.7:
-            crisis_score += 1
-        elif sentiment['compound'] < -0.5:
-            crisis_score += 0.5
+        result = self._detect_crisis_uncached(message, ruleset, embedding if backend == "embedding" else None)
+        self.result_cache.set(cache_key, result)
+        return copy.deepcopy(result)
+    
+    def _detect_crisis_uncached(
+        self,
+        message: str,
+        ruleset: CrisisRuleset,
+        embedding: Optional[Sequence[float]] = None
+    ) -> Dict:
+        """Full keyword scan and sentiment analysis for one message"""
+        # Lowercase and collapse whitespace so one scan covers both forms
+        message_normalized = normalize_text(message)
+        
+        # Single pass over the message with the compiled keyword automaton
+        matches = ruleset.keyword_matcher.scan(message_normalized)
+        crisis_score, detected, high_severity_detected = self._score_keywords(matches, ruleset)
+        
+        # Sentiment analysis (reuse the message embedding when available)
+        if embedding is not None:
+            sentiment = {"compound": sentiment_head.predict(embedding)}
+        else:
+            sentiment = self.analyzer.polarity_scores(message)
+        crisis_score += self._sentiment_adjustment(sentiment['compound'])
         
         # Determine if this is a crisis
         # High severity keyword = immediate crisis
@@ -115,14 +276,143 @@ class CrisisService:
         result = {
             "is_crisis": is_crisis,
             "score": crisis_score,
-            "keywords_detected": detected_keywords,
-            "sentiment": sentiment
+            "keywords_detected": [match.keyword for match in detected],
+            "keyword_matches": [match._asdict() for match in matches],
+            "sentiment": sentiment,
+            "sentiment_backend": "embedding" if embedding is not None else "vader",
+            "ruleset_version": ruleset.version
         }
         
         if is_crisis:
-            result["resources"] = self.resources
+            result["resources"] = ruleset.resources
         
         return result
+    
+    def detect_crisis_batch(
+        self,
+        messages: Sequence[str],
+        chunk_size: int = BATCH_CHUNK_SIZE,
+        compound: Optional[Sequence[float]] = None
+    ) -> CrisisBatchResult:
+        """
+        Score many messages at once for offline rescans and backfills.
+        
+        Produces the same is_crisis/score values as detect_crisis, but returns
+        them as columnar arrays instead of one dict per message. Keyword ids
+        index into keyword_matcher.keywords. Precomputed compound sentiment
+        scores (e.g. from the embedding head) can be passed to skip VADER.
+        """
+        precomputed = compound
+        count = len(messages)
+        is_crisis = np.zeros(count, dtype=bool)
+        scores = np.zeros(count, dtype=np.float32)
+        compound = np.zeros(count, dtype=np.float32)
+        keyword_offsets = np.zeros(count + 1, dtype=np.int64)
+        keyword_ids: List[int] = []
+        
+        ruleset = self._ruleset
+        scan = ruleset.keyword_matcher.scan
+        polarity_scores = self.analyzer.polarity_scores
+        
+        for chunk_start in range(0, count, chunk_size):
+            chunk = messages[chunk_start:chunk_start + chunk_size]
+            normalized = [normalize_text(message) for message in chunk]
+            if precomputed is not None:
+                sentiments = [float(value) for value in precomputed[chunk_start:chunk_start + chunk_size]]
+            else:
+                sentiments = [polarity_scores(message)['compound'] for message in chunk]
+            
+            for offset, (text, sentiment) in enumerate(zip(normalized, sentiments)):
+                index = chunk_start + offset
+                crisis_score, detected, high_severity_detected = self._score_keywords(scan(text), ruleset)
+                crisis_score += self._sentiment_adjustment(sentiment)
+                
+                is_crisis[index] = high_severity_detected or crisis_score >= 3
+                scores[index] = crisis_score
+                compound[index] = sentiment
+                keyword_ids.extend(match.keyword_id for match in detected)
+                keyword_offsets[index + 1] = len(keyword_ids)
+        
+        return CrisisBatchResult(
+            is_crisis=is_crisis,
+            scores=scores,
+            compound=compound,
+            keyword_ids=np.asarray(keyword_ids, dtype=np.int32),
+            keyword_offsets=keyword_offsets,
+            keywords=ruleset.keyword_matcher.keywords
+        )
+
+    async def detect_crisis_async(self, message: str, embedding: Optional[Sequence[float]] = None) -> Dict:
+        """
+        Detect crisis without blocking the event loop.
+        Short messages are scored inline; everything else runs on the bounded
+        scoring pool, and callers wait for a slot once CRISIS_EXECUTOR_MAX_PENDING
+        requests are queued.
+        """
+        if len(message) <= settings.CRISIS_INLINE_MAX_CHARS:
+            with self._metrics_lock:
+                self._metrics["inline"] += 1
+            return self.detect_crisis(message, embedding)
+        
+        # Repeated messages are a dictionary lookup; no need to queue them
+        cached = self.result_cache.get(
+            self._cache_key(message, self._ruleset, self._sentiment_backend(embedding))
+        )
+        if cached is not None:
+            return copy.deepcopy(cached)
+        
+        with self._metrics_lock:
+            self._pending += 1
+            self._metrics["max_queue_depth"] = max(
+                self._metrics["max_queue_depth"], self._pending - self._running
+            )
+        
+        try:
+            async with self._executor_slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._executor, self._detect_crisis_timed, message, embedding, time.perf_counter()
+                )
+        finally:
+            with self._metrics_lock:
+                self._pending -= 1
+    
+    def _detect_crisis_timed(self, message: str, embedding, submitted_at: float) -> Dict:
+        """Executor body: score and record queue/run times"""
+        started_at = time.perf_counter()
+        with self._metrics_lock:
+            self._running += 1
+            self._metrics["offloaded"] += 1
+            self._metrics["queue_wait_seconds_total"] += started_at - submitted_at
+        
+        try:
+            return self.detect_crisis(message, embedding)
+        finally:
+            with self._metrics_lock:
+                self._running -= 1
+                self._metrics["run_seconds_total"] += time.perf_counter() - started_at
+    
+    def cache_stats(self) -> Dict:
+        """Hit/miss counters for the result cache"""
+        return {"ruleset_version": self._ruleset.version, **self.result_cache.stats()}
+    
+    def executor_stats(self) -> Dict:
+        """Queue-depth and timing metrics for the scoring pool"""
+        with self._metrics_lock:
+            offloaded = self._metrics["offloaded"]
+            return {
+                "workers": settings.CRISIS_EXECUTOR_WORKERS,
+                "max_pending": settings.CRISIS_EXECUTOR_MAX_PENDING,
+                "queue_depth": self._pending - self._running,
+                "running": self._running,
+                **self._metrics,
+                "avg_queue_wait_ms": (self._metrics["queue_wait_seconds_total"] / offloaded * 1000) if offloaded else 0.0,
+                "avg_run_ms": (self._metrics["run_seconds_total"] / offloaded * 1000) if offloaded else 0.0
+            }
+    
+    def shutdown(self):
+        """Stop the scoring pool"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 
 # Global instance
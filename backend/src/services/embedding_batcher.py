@@ -0,0 +1,148 @@
+"""
+Cross-request dynamic micro-batching for sentence-transformer embeddings
+
+A dedicated worker thread collects encode requests from every concurrent
+handler for up to EMBEDDING_BATCH_MAX_SIZE items or EMBEDDING_BATCH_MAX_WAIT_MS
+milliseconds, runs one batched encode, and resolves each caller's future on its
+own event loop. Callers await the result instead of blocking the loop.
+"""
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    """Background thread that turns many single encodes into batched ones"""
+
+    def __init__(self, encoder=None):
+        self.encoder = encoder
+        self._requests: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics = {
+            "requests": 0,
+            "batches": 0,
+            "items_encoded": 0,
+            "max_batch_size": 0,
+            "encode_seconds_total": 0.0
+        }
+
+    def start(self, encoder):
+        """Start the worker thread for the given SentenceTransformer"""
+        self.encoder = encoder
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._thread.start()
+            logger.info(
+                f"✅ Embedding batcher started (max {settings.EMBEDDING_BATCH_MAX_SIZE} items / "
+                f"{settings.EMBEDDING_BATCH_MAX_WAIT_MS} ms)"
+            )
+
+    def stop(self):
+        """Stop the worker thread after it finishes the current batch"""
+        if self._thread is not None:
+            self._requests.put(_STOP)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    async def encode(self, text: str) -> List[float]:
+        """Queue one text and await its embedding"""
+        if self._thread is None:
+            raise RuntimeError("Embedding batcher not started.")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._requests.put((text, loop, future))
+        self._metrics["requests"] += 1
+        return await future
+
+    def _collect(self) -> List:
+        """Block for the first request, then gather more until size or deadline"""
+        first = self._requests.get()
+        if first is _STOP:
+            return [first]
+
+        batch = [first]
+        deadline = time.monotonic() + settings.EMBEDDING_BATCH_MAX_WAIT_MS / 1000
+
+        while len(batch) < settings.EMBEDDING_BATCH_MAX_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+
+        return batch
+
+    def _run(self):
+        """Worker loop: collect, encode once, resolve futures"""
+        while True:
+            batch = self._collect()
+            stopping = batch[-1] is _STOP
+            requests = [item for item in batch if item is not _STOP]
+
+            if requests:
+                self._encode_batch(requests)
+            if stopping:
+                return
+
+    def _encode_batch(self, requests: List):
+        """Encode a batch and hand each result back to its caller's loop"""
+        texts = [text for text, _, _ in requests]
+        started = time.perf_counter()
+
+        try:
+            vectors = self.encoder.encode(
+                texts,
+                batch_size=len(texts),
+                convert_to_numpy=True
+            ).tolist()
+            error = None
+        except Exception as e:
+            logger.error(f"❌ Batched encode of {len(texts)} texts failed: {e}")
+            vectors, error = None, e
+
+        self._metrics["batches"] += 1
+        self._metrics["items_encoded"] += len(texts)
+        self._metrics["max_batch_size"] = max(self._metrics["max_batch_size"], len(texts))
+        self._metrics["encode_seconds_total"] += time.perf_counter() - started
+
+        for index, (_, loop, future) in enumerate(requests):
+            result = vectors[index] if error is None else None
+            try:
+                loop.call_soon_threadsafe(self._resolve, future, result, error)
+            except RuntimeError:
+                # Caller's event loop has already closed
+                pass
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result, error: Optional[Exception]):
+        """Set a future's outcome unless the caller already gave up on it"""
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def stats(self) -> Dict:
+        """Batching counters"""
+        batches = self._metrics["batches"]
+        return {
+            "queue_depth": self._requests.qsize(),
+            **self._metrics,
+            "avg_batch_size": self._metrics["items_encoded"] / batches if batches else 0.0
+        }
@@ -0,0 +1,185 @@
+"""
+Content-addressed embedding cache
+
+Keys are a hash of the embedding model name plus the exact text. Lookups go to
+an in-memory LRU tier first and then to an on-disk tier: a fixed-width float32
+vector file and a uint64 key table, both memory-mapped, so entries survive
+restarts and are shared by every worker on the host.
+
+The disk tier is an open-addressing hash table. Writers take an exclusive
+flock on a sidecar lock file (plus a thread lock within the process), then
+clear a slot's key, write the vector and publish the key, so two writers can
+never interleave on a slot. Readers take no lock: a reader that sees the same
+matching key before and after copying the vector has read a complete one.
+When every probe slot is taken the home slot is overwritten.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional
+import fcntl
+import hashlib
+import logging
+import re
+import threading
+
+import numpy as np
+
+from src.utils.cache import TTLCache
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Slots inspected per lookup/insert before giving up (lookups) or evicting (inserts)
+MAX_PROBE = 8
+
+
+def _open_memmap(path: Path, dtype, shape) -> np.memmap:
+    """Create a zero-filled file of the right size if missing, then map it read/write"""
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    try:
+        with open(path, 'xb') as f:
+            f.truncate(nbytes)
+    except FileExistsError:
+        pass
+    return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+
+class DiskEmbeddingStore:
+    """Memory-mapped fixed-capacity vector table shared between processes"""
+
+    def __init__(self, directory: str, model_name: str, dim: int, capacity: int):
+        self.dim = dim
+        self.capacity = capacity
+
+        base = Path(directory)
+        base.mkdir(parents=True, exist_ok=True)
+        stem = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)}_{dim}d_{capacity}"
+
+        self.keys = _open_memmap(base / f"{stem}.keys", np.uint64, (capacity,))
+        self.vectors = _open_memmap(base / f"{stem}.vectors", np.float32, (capacity, dim))
+        self._lock_file = open(base / f"{stem}.lock", 'a')
+        self._thread_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: int) -> Optional[np.ndarray]:
+        """Vector for a key, or None"""
+        for probe in range(MAX_PROBE):
+            slot = (key + probe) % self.capacity
+            stored = int(self.keys[slot])
+            if stored == key:
+                vector = np.array(self.vectors[slot])
+                # Re-check in case another process replaced the slot mid-read
+                if int(self.keys[slot]) == key:
+                    self.hits += 1
+                    return vector
+                break
+            if stored == 0:
+                break
+        self.misses += 1
+        return None
+
+    def put(self, key: int, vector: np.ndarray):
+        """Store a vector, evicting the home slot if the probe window is full"""
+        # flock serializes processes; the thread lock covers threads sharing this descriptor
+        with self._thread_lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                target = key % self.capacity
+                for probe in range(MAX_PROBE):
+                    slot = (key + probe) % self.capacity
+                    stored = int(self.keys[slot])
+                    if stored == key:
+                        return
+                    if stored == 0:
+                        target = slot
+                        break
+
+                self.keys[target] = 0
+                self.vectors[target] = vector
+                self.keys[target] = key
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def stats(self) -> Dict:
+        """Occupancy and byte counts"""
+        entries = int(np.count_nonzero(self.keys))
+        slot_bytes = self.dim * 4 + 8
+        return {
+            "entries": entries,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_used": entries * slot_bytes,
+            "bytes_allocated": self.capacity * slot_bytes
+        }
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU + mmap disk) cache in front of the encoder"""
+
+    def __init__(self, model_name: str, dim: int):
+        self.model_name = model_name
+        self.dim = dim
+        self.memory = TTLCache(max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES)
+        self.disk: Optional[DiskEmbeddingStore] = None
+
+        if settings.EMBEDDING_CACHE_DISK_ENABLED:
+            try:
+                self.disk = DiskEmbeddingStore(
+                    directory=settings.EMBEDDING_CACHE_DIR,
+                    model_name=model_name,
+                    dim=dim,
+                    capacity=settings.EMBEDDING_CACHE_DISK_CAPACITY
+                )
+            except Exception as e:
+                logger.error(f"❌ Failed to open on-disk embedding cache, using memory only: {e}")
+
+    def _digest(self, text: str) -> bytes:
+        """Content address of (model, text)"""
+        return hashlib.blake2b(
+            f"{self.model_name}\0{text}".encode("utf-8"),
+            digest_size=16
+        ).digest()
+
+    @staticmethod
+    def _disk_key(digest: bytes) -> int:
+        """Non-zero 64-bit key for the disk table (0 marks an empty slot)"""
+        return int.from_bytes(digest[:8], "little") or 1
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """Cached embedding for text, or None"""
+        digest = self._digest(text)
+
+        vector = self.memory.get(digest)
+        if vector is None and self.disk is not None:
+            vector = self.disk.get(self._disk_key(digest))
+            if vector is not None:
+                self.memory.set(digest, vector)
+
+        return vector.tolist() if vector is not None else None
+
+    def put(self, text: str, embedding: List[float]):
+        """Store an embedding in both tiers"""
+        digest = self._digest(text)
+        vector = np.asarray(embedding, dtype=np.float32)
+
+        self.memory.set(digest, vector)
+        if self.disk is not None:
+            try:
+                self.disk.put(self._disk_key(digest), vector)
+            except Exception as e:
+                logger.error(f"❌ Failed to write embedding to disk cache: {e}")
+
+    def stats(self) -> Dict:
+        """Per-tier hit rates and bytes used"""
+        memory_stats = self.memory.stats()
+        memory_stats["bytes_used"] = memory_stats["entries"] * self.dim * 4
+
+        lookups = memory_stats["hits"] + memory_stats["misses"]
+        disk_hits = self.disk.hits if self.disk is not None else 0
+        return {
+            "model": self.model_name,
+            "hit_rate": (memory_stats["hits"] + disk_hits) / lookups if lookups else 0.0,
+            "memory": memory_stats,
+            "disk": self.disk.stats() if self.disk is not None else None
+        }
@@ -0,0 +1,472 @@
+"""
+Asynchronous guardian alert dispatcher
+
+Crisis events are queued in-process and handled by a small pool of worker
+tasks. The per-user cooldown (GUARDIAN_ALERT_COOLDOWN_HOURS) is enforced from
+an in-memory index warmed from guardian_alerts at startup, so no query runs per
+event. Messages go out through a pluggable transport (Twilio WhatsApp, SMTP or
+a local stub) with retry and backoff, and GuardianAlert rows are recorded in
+batches. The chat request only enqueues.
+
+On shutdown the queue is drained for up to GUARDIAN_ALERT_DRAIN_TIMEOUT_SECONDS;
+alerts still unsent are recorded with status 'pending' and sent again by the
+next start.
+"""
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.exc import DataError, IntegrityError
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import httpx
+import logging
+import smtplib
+import threading
+
+from src.models.database import AsyncSessionLocal
+from src.models.models import GuardianAlert
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+ALERT_TEMPLATE = (
+    "NeuroWellCA alert: {name} may be going through a very difficult time and could use "
+    "your support right now. Please reach out to them. If you believe they are in "
+    "immediate danger, call emergency services (112)."
+)
+
+
+class AlertTransport(ABC):
+    """Base class for outbound alert channels"""
+    method = "stub"
+
+    async def start(self):
+        pass
+
+    @abstractmethod
+    async def send(self, contact: str, message: str):
+        """Deliver one message; raise on failure so the dispatcher retries"""
+
+    async def close(self):
+        pass
+
+
+class StubTransport(AlertTransport):
+    """Records messages instead of sending them (local development and tests)"""
+    method = "stub"
+
+    def __init__(self):
+        self.sent: List[Dict] = []
+
+    async def send(self, contact: str, message: str):
+        self.sent.append({"contact": contact, "message": message})
+        logger.info(f"📨 [stub] Guardian alert to {contact}")
+
+
+class TwilioWhatsAppTransport(AlertTransport):
+    """Twilio Messages API over a pooled keep-alive HTTP client"""
+    method = "whatsapp"
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            base_url=f"https://api.twilio.com/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}",
+            auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.GUARDIAN_ALERT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GUARDIAN_ALERT_MAX_CONNECTIONS
+            )
+        )
+
+    async def send(self, contact: str, message: str):
+        to = contact if contact.startswith("whatsapp:") else f"whatsapp:{contact}"
+        response = await self._client.post(
+            "/Messages.json",
+            data={"From": settings.TWILIO_WHATSAPP_FROM, "To": to, "Body": message}
+        )
+        response.raise_for_status()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class SMTPTransport(AlertTransport):
+    """Email alerts over one reused, authenticated SMTP connection"""
+    method = "email"
+
+    def __init__(self):
+        self._connection: Optional[smtplib.SMTP] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=10)
+        connection.starttls()
+        connection.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        return connection
+
+    def _send_sync(self, contact: str, message: str):
+        email = MIMEText(message, 'plain')
+        email['From'] = f"{settings.SMTP_FROM_NAME} <{settings.SMTP_USER}>"
+        email['To'] = contact
+        email['Subject'] = 'NeuroWellCA - Please check in'
+
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._connect()
+            try:
+                self._connection.send_message(email)
+            except smtplib.SMTPServerDisconnected:
+                # Server dropped the idle connection; reconnect once
+                self._connection = self._connect()
+                self._connection.send_message(email)
+
+    async def send(self, contact: str, message: str):
+        await asyncio.to_thread(self._send_sync, contact, message)
+
+    async def close(self):
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.quit()
+                except Exception:
+                    pass
+                self._connection = None
+
+
+def build_transport() -> AlertTransport:
+    """Transport selected by GUARDIAN_ALERT_TRANSPORT, falling back to the stub when unconfigured"""
+    transport = settings.GUARDIAN_ALERT_TRANSPORT
+
+    if transport == "twilio":
+        if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN and settings.TWILIO_WHATSAPP_FROM:
+            return TwilioWhatsAppTransport()
+        logger.warning("⚠️ Twilio not configured. Guardian alerts will use the stub transport.")
+    elif transport == "smtp":
+        if settings.SMTP_SERVER and settings.SMTP_USER and settings.SMTP_PASSWORD:
+            return SMTPTransport()
+        logger.warning("⚠️ SMTP not configured. Guardian alerts will use the stub transport.")
+
+    return StubTransport()
+
+
+class GuardianAlertDispatcher:
+    """Queue, cooldown index, retrying workers and batched GuardianAlert recording"""
+
+    def __init__(self):
+        self.transport: AlertTransport = StubTransport()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._recorder: Optional[asyncio.Task] = None
+        self._last_alert: Dict[int, datetime] = {}  # user_id -> last alert time (cooldown index)
+        self._records: List[Tuple[Dict, int]] = []  # (row, failed flush attempts)
+        self._closing = False
+        self._metrics = {
+            "enqueued": 0,
+            "suppressed_cooldown": 0,
+            "dropped_queue_full": 0,
+            "sent": 0,
+            "failed": 0,
+            "retries": 0,
+            "recorded": 0,
+            "records_dropped": 0,
+            "left_pending": 0,
+            "resumed_pending": 0
+        }
+
+    @property
+    def cooldown(self) -> timedelta:
+        return timedelta(hours=settings.GUARDIAN_ALERT_COOLDOWN_HOURS)
+
+    async def start(self):
+        """Warm the cooldown index, open the transport and start workers"""
+        self.transport = build_transport()
+        await self.transport.start()
+        await self._warm_cooldown_index()
+
+        self._closing = False
+        self._queue = asyncio.Queue(maxsize=settings.GUARDIAN_ALERT_QUEUE_SIZE)
+        await self._resume_pending()
+        self._workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(settings.GUARDIAN_ALERT_WORKERS)
+        ]
+        self._recorder = asyncio.create_task(self._record_loop())
+        logger.info(f"✅ Guardian alert dispatcher started ({self.transport.method} transport)")
+
+    async def stop(self):
+        """Drain the queue, record unsent alerts as pending, then close the transport"""
+        self._closing = True
+        if self._queue is not None and self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=settings.GUARDIAN_ALERT_DRAIN_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Guardian alert queue not drained in time; {self._queue.qsize()} alerts left pending")
+
+        # Workers record the alert they were sending as pending when cancelled
+        for task in self._workers + ([self._recorder] if self._recorder else []):
+            task.cancel()
+        await asyncio.gather(*self._workers, *([self._recorder] if self._recorder else []), return_exceptions=True)
+        self._workers = []
+        self._recorder = None
+
+        while self._queue is not None and not self._queue.empty():
+            self._record_pending(self._queue.get_nowait())
+
+        await self._flush_records()
+        if self._records:
+            logger.error(f"❌ {len(self._records)} guardian alert records could not be written before shutdown")
+        await self.transport.close()
+        self._queue = None
+
+    async def _warm_cooldown_index(self):
+        """Load the most recent sent alert per user within the cooldown window"""
+        try:
+            since = datetime.now(timezone.utc) - self.cooldown
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(GuardianAlert.user_id, func.max(GuardianAlert.created_at))
+                    .where(GuardianAlert.alert_sent == True)  # noqa: E712
+                    .where(GuardianAlert.created_at >= since)
+                    .group_by(GuardianAlert.user_id)
+                )
+                self._last_alert = {user_id: created_at for user_id, created_at in result.all()}
+            logger.info(f"✅ Guardian alert cooldown index warmed with {len(self._last_alert)} users")
+        except Exception as e:
+            logger.error(f"❌ Failed to warm guardian alert cooldown index: {e}")
+
+    async def _resume_pending(self):
+        """Claim alerts left pending by a previous shutdown and queue them again"""
+        try:
+            since = datetime.now(timezone.utc) - self.cooldown
+            async with AsyncSessionLocal() as db:
+                # Too old to be useful any more
+                await db.execute(
+                    update(GuardianAlert)
+                    .where(GuardianAlert.status == "pending")
+                    .where(GuardianAlert.created_at < since)
+                    .values(status="failed")
+                )
+                # Deleting claims each row for exactly one worker; it is recorded again once handled
+                result = await db.execute(
+                    delete(GuardianAlert)
+                    .where(GuardianAlert.status == "pending")
+                    .returning(
+                        GuardianAlert.user_id,
+                        GuardianAlert.guardian_contact,
+                        GuardianAlert.message_sent,
+                        GuardianAlert.created_at
+                    )
+                )
+                rows = result.all()
+                await db.commit()
+        except Exception as e:
+            logger.error(f"❌ Failed to resume pending guardian alerts: {e}")
+            return
+
+        for user_id, guardian_contact, message, created_at in rows:
+            event = {
+                "user_id": user_id,
+                "guardian_contact": guardian_contact,
+                "message": message,
+                "created_at": created_at
+            }
+            try:
+                self._queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._record_pending(event)
+                continue
+            self._last_alert[user_id] = datetime.now(timezone.utc)
+            self._metrics["resumed_pending"] += 1
+
+        if rows:
+            logger.info(f"✅ Resumed {len(rows)} pending guardian alerts")
+
+    def in_cooldown(self, user_id: int) -> bool:
+        """Whether a guardian was alerted for this user within the cooldown window"""
+        last = self._last_alert.get(user_id)
+        return last is not None and datetime.now(timezone.utc) - last < self.cooldown
+
+    def submit(
+        self,
+        user_id: int,
+        guardian_contact: Optional[str],
+        display_name: str
+    ) -> bool:
+        """
+        Queue a guardian alert for a crisis event. Returns True if an alert was
+        queued, False if the user has no guardian, is in cooldown, or the queue is full.
+        """
+        if not guardian_contact or self._queue is None:
+            return False
+
+        if self.in_cooldown(user_id):
+            self._metrics["suppressed_cooldown"] += 1
+            return False
+
+        event = {
+            "user_id": user_id,
+            "guardian_contact": guardian_contact,
+            "message": ALERT_TEMPLATE.format(name=display_name),
+            "created_at": datetime.now(timezone.utc)
+        }
+
+        if self._closing:
+            # Shutting down: the next start sends it
+            self._record_pending(event)
+            self._last_alert[user_id] = event["created_at"]
+            return True
+
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._metrics["dropped_queue_full"] += 1
+            logger.error(f"❌ Guardian alert queue full; alert for user {user_id} dropped")
+            return False
+
+        # Reserve the cooldown slot now so a burst of crisis messages sends one alert
+        self._last_alert[user_id] = datetime.now(timezone.utc)
+        self._metrics["enqueued"] += 1
+        return True
+
+    async def _worker(self):
+        """Send queued alerts one at a time"""
+        while True:
+            event = await self._queue.get()
+            try:
+                await self._deliver(event)
+            except asyncio.CancelledError:
+                self._record_pending(event)
+                raise
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, event: Dict):
+        """Send one alert with retry and exponential backoff, then queue its record"""
+        message = event["message"]
+        sent = False
+
+        for attempt in range(settings.GUARDIAN_ALERT_MAX_RETRIES + 1):
+            try:
+                await self.transport.send(event["guardian_contact"], message)
+                sent = True
+                break
+            except Exception as e:
+                logger.warning(f"⚠️ Guardian alert attempt {attempt + 1} for user {event['user_id']} failed: {e}")
+                if attempt < settings.GUARDIAN_ALERT_MAX_RETRIES:
+                    self._metrics["retries"] += 1
+                    await asyncio.sleep(settings.GUARDIAN_ALERT_RETRY_BACKOFF_SECONDS * (2 ** attempt))
+
+        if sent:
+            self._metrics["sent"] += 1
+            logger.info(f"✅ Guardian alert sent for user {event['user_id']}")
+        else:
+            self._metrics["failed"] += 1
+            # Release the cooldown reservation so the next crisis retries
+            self._last_alert.pop(event["user_id"], None)
+            logger.error(f"❌ Guardian alert for user {event['user_id']} failed after retries")
+
+        self._record(event, status="sent" if sent else "failed", created_at=datetime.now(timezone.utc))
+
+    def _record(self, event: Dict, status: str, created_at: datetime):
+        """Queue a GuardianAlert row for the next batched insert"""
+        self._records.append(({
+            "user_id": event["user_id"],
+            "guardian_contact": event["guardian_contact"],
+            "alert_sent": status == "sent",
+            "alert_method": self.transport.method,
+            "message_sent": event["message"],
+            "status": status,
+            "created_at": created_at
+        }, 0))
+
+    def _record_pending(self, event: Dict):
+        """Keep an unsent alert (with its original time) for the next start"""
+        self._metrics["left_pending"] += 1
+        self._record(event, status="pending", created_at=event["created_at"])
+
+    async def _record_loop(self):
+        """Periodically write GuardianAlert rows in batches"""
+        while True:
+            await asyncio.sleep(settings.GUARDIAN_ALERT_RECORD_INTERVAL_SECONDS)
+            await self._flush_records()
+            self._prune_cooldown_index()
+
+    def _prune_cooldown_index(self):
+        """Forget users whose cooldown has expired"""
+        cutoff = datetime.now(timezone.utc) - self.cooldown
+        expired = [user_id for user_id, last in self._last_alert.items() if last < cutoff]
+        for user_id in expired:
+            del self._last_alert[user_id]
+
+    async def _flush_records(self):
+        """Insert pending GuardianAlert rows with one multi-row INSERT"""
+        if not self._records:
+            return
+
+        records, self._records = self._records, []
+        retry: List[Tuple[Dict, int]] = []
+        try:
+            await self._insert_records([row for row, _ in records])
+            self._metrics["recorded"] += len(records)
+        except (IntegrityError, DataError) as e:
+            # One bad row rejects the whole statement; write the rest one by one
+            logger.error(f"❌ Guardian alert batch rejected, retrying rows individually: {e}")
+            for record in records:
+                try:
+                    await self._insert_records([record[0]])
+                    self._metrics["recorded"] += 1
+                except (IntegrityError, DataError) as row_error:
+                    self._drop_records(1, f"row rejected: {row_error}")
+                except Exception:
+                    retry.append(record)
+        except Exception as e:
+            logger.error(f"❌ Failed to record {len(records)} guardian alerts: {e}")
+            retry = records
+
+        if retry:
+            self._requeue_records(retry)
+
+    @staticmethod
+    async def _insert_records(rows: List[Dict]):
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(GuardianAlert).values(rows))
+            await db.commit()
+
+    def _requeue_records(self, records: List[Tuple[Dict, int]]):
+        """Keep failed rows for the next flush, within the attempt and size limits"""
+        kept = [
+            (row, attempts + 1) for row, attempts in records
+            if attempts + 1 < settings.GUARDIAN_ALERT_RECORD_MAX_ATTEMPTS
+        ]
+        if len(kept) < len(records):
+            self._drop_records(len(records) - len(kept), "too many failed attempts")
+
+        self._records = kept + self._records
+        overflow = len(self._records) - settings.GUARDIAN_ALERT_MAX_PENDING_RECORDS
+        if overflow > 0:
+            self._records = self._records[overflow:]
+            self._drop_records(overflow, "too many unwritten records")
+
+    def _drop_records(self, count: int, reason: str):
+        self._metrics["records_dropped"] += count
+        logger.error(f"❌ Dropped {count} guardian alert records ({reason})")
+
+    def stats(self) -> Dict:
+        """Queue depth, cooldown index size and delivery counters"""
+        return {
+            "transport": self.transport.method,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "cooldown_index_size": len(self._last_alert),
+            "pending_records": len(self._records),
+            **self._metrics
+        }
+
+
+# Global instance
+guardian_alert_dispatcher = GuardianAlertDispatcher()
@@ -0,0 +1,128 @@
+"""
+Multi-pattern keyword matcher (Aho-Corasick automaton) for crisis detection
+"""
+from collections import deque
+from typing import Dict, List, NamedTuple
+
+
+class KeywordMatch(NamedTuple):
+    """A single keyword occurrence in a scanned message"""
+    keyword_id: int
+    keyword: str
+    category: str
+    start: int
+    end: int
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace, the form both keywords and messages are scanned in"""
+    return ' '.join(text.lower().split())
+
+
+class KeywordMatcher:
+    """
+    Compiles a {category: [phrases]} mapping into a single Aho-Corasick automaton.
+
+    The automaton is built once and scanned in one pass over the message, so the
+    cost of a scan depends on the message length rather than on the number of
+    phrases. Keyword ids follow the order of the input mapping (category order,
+    then phrase order), which is also the priority used when picking the
+    representative keyword of a category.
+    """
+
+    def __init__(self, keywords_by_category: Dict[str, List[str]]):
+        self.keywords: List[str] = []
+        self.categories: List[str] = []
+
+        # Goto transitions, failure links and output sets, indexed by state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for category, phrases in keywords_by_category.items():
+            for phrase in phrases:
+                keyword = normalize_text(phrase)
+                if not keyword:
+                    continue
+                keyword_id = len(self.keywords)
+                self.keywords.append(keyword)
+                self.categories.append(category)
+                self._insert(keyword, keyword_id)
+
+        self._build_failure_links()
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def _insert(self, keyword: str, keyword_id: int):
+        """Add a keyword to the trie"""
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append(keyword_id)
+
+    def _build_failure_links(self):
+        """Breadth-first construction of failure links and merged outputs"""
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                fail_state = self._goto[fallback].get(char, 0)
+                if fail_state == next_state:
+                    fail_state = 0
+
+                self._fail[next_state] = fail_state
+                self._output[next_state] = self._output[next_state] + self._output[fail_state]
+
+    def scan(self, text: str) -> List[KeywordMatch]:
+        """
+        Scan already-normalized text and return every keyword occurrence,
+        ordered by end offset
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        matches = []
+        state = 0
+
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            if output[state]:
+                end = index + 1
+                for keyword_id in output[state]:
+                    keyword = self.keywords[keyword_id]
+                    matches.append(KeywordMatch(
+                        keyword_id=keyword_id,
+                        keyword=keyword,
+                        category=self.categories[keyword_id],
+                        start=end - len(keyword),
+                        end=end
+                    ))
+
+        return matches
+
+    def first_match_per_category(self, matches: List[KeywordMatch]) -> Dict[str, KeywordMatch]:
+        """Pick the highest-priority (lowest id) match for each category"""
+        best: Dict[str, KeywordMatch] = {}
+        for match in matches:
+            current = best.get(match.category)
+            if current is None or match.keyword_id < current.keyword_id:
+                best[match.category] = match
+        return best
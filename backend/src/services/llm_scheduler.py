@@ -0,0 +1,232 @@
+"""
+Admission control in front of the LLM
+
+At most LLM_MAX_IN_FLIGHT generations run per worker. Further requests wait in
+a bounded priority queue for up to LLM_QUEUE_TIMEOUT_SECONDS; when the queue is
+full a new request is rejected immediately (the caller answers 503 with
+Retry-After) instead of piling onto Ollama and timing out with everyone else.
+
+Users with a crisis in the last LLM_PRIORITY_CRISIS_WINDOW_SECONDS or a severe
+latest assessment are served first, then moderate risk, then everyone else;
+FIFO within a priority. A full queue makes room for a more urgent request by
+rejecting its least urgent, newest waiter.
+"""
+from sqlalchemy import select
+from datetime import datetime, timedelta, timezone
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+
+from src.models.database import AsyncSessionLocal
+from src.models.models import Assessment, CrisisLog, RiskLevel
+from src.utils.cache import TTLCache
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_URGENT = 0
+PRIORITY_ELEVATED = 1
+PRIORITY_NORMAL = 2
+
+PRIORITY_NAMES = {PRIORITY_URGENT: "urgent", PRIORITY_ELEVATED: "elevated", PRIORITY_NORMAL: "normal"}
+
+HIGH_RISK_LEVELS = {RiskLevel.SEVERE, RiskLevel.MODERATELY_SEVERE}
+
+
+class SchedulerRejected(Exception):
+    """The request was not admitted; retry after retry_after seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"LLM request rejected ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    """In-flight limit plus a bounded, deadline-limited priority wait queue"""
+
+    def __init__(self):
+        self.limit = settings.LLM_MAX_IN_FLIGHT or settings.OLLAMA_MAX_CONNECTIONS
+        self.max_queue = settings.LLM_QUEUE_MAX_SIZE
+        self._in_flight = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._priorities = TTLCache(
+            max_entries=settings.LLM_PRIORITY_CACHE_MAX_USERS,
+            ttl_seconds=settings.LLM_PRIORITY_CACHE_TTL_SECONDS
+        )
+        self._avg_hold_seconds: Optional[float] = None
+        self._recent_waits: deque = deque(maxlen=1000)
+        self._metrics = {
+            "admitted": 0,
+            "admitted_immediately": 0,
+            "rejected_queue_full": 0,
+            "expired": 0,
+            "preempted": 0,
+            "cancelled": 0,
+            "peak_queue_depth": 0,
+            "wait_seconds_total": 0.0,
+            "max_wait_seconds": 0.0
+        }
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL) -> float:
+        """Wait for a generation slot; returns the grant time to pass to release()"""
+        if self._in_flight < self.limit and not self._queue:
+            self._in_flight += 1
+            self._metrics["admitted_immediately"] += 1
+            return self._admitted(0.0)
+
+        if len(self._queue) >= self.max_queue:
+            self._make_room(priority)
+
+        entry = (priority, next(self._seq), asyncio.get_running_loop().create_future())
+        future = entry[2]
+        heapq.heappush(self._queue, entry)
+        self._metrics["peak_queue_depth"] = max(self._metrics["peak_queue_depth"], len(self._queue))
+        enqueued = time.monotonic()
+
+        try:
+            await asyncio.wait_for(future, timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self._discard(entry)
+            self._metrics["expired"] += 1
+            raise SchedulerRejected("queue_timeout", self.retry_after())
+        except asyncio.CancelledError:
+            # Caller went away; give back a slot that was granted but never used
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(time.monotonic())
+            else:
+                self._discard(entry)
+            self._metrics["cancelled"] += 1
+            raise
+
+        return self._admitted(time.monotonic() - enqueued)
+
+    def release(self, granted_at: float):
+        """Free a slot and hand it to the most urgent live waiter"""
+        held = time.monotonic() - granted_at
+        if self._avg_hold_seconds is None:
+            self._avg_hold_seconds = held
+        else:
+            self._avg_hold_seconds = 0.9 * self._avg_hold_seconds + 0.1 * held
+
+        self._in_flight -= 1
+        while self._queue and self._in_flight < self.limit:
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._in_flight += 1
+            future.set_result(None)
+
+    def check_admission(self, priority: int = PRIORITY_NORMAL):
+        """Raise SchedulerRejected now if acquire() could not even queue this request"""
+        if self._in_flight < self.limit or len(self._queue) < self.max_queue:
+            return
+        if self._queue and max(self._queue)[0] > priority:
+            return
+        self._metrics["rejected_queue_full"] += 1
+        raise SchedulerRejected("queue_full", self.retry_after())
+
+    def _make_room(self, priority: int):
+        """Reject the least urgent, newest waiter for a more urgent request, else this one"""
+        worst = max(self._queue)
+        if worst[0] <= priority:
+            self._metrics["rejected_queue_full"] += 1
+            raise SchedulerRejected("queue_full", self.retry_after())
+
+        self._discard(worst)
+        worst[2].set_exception(SchedulerRejected("preempted", self.retry_after()))
+        self._metrics["preempted"] += 1
+
+    def _discard(self, entry: Tuple[int, int, asyncio.Future]):
+        try:
+            self._queue.remove(entry)
+        except ValueError:
+            return
+        heapq.heapify(self._queue)
+
+    def _admitted(self, waited: float) -> float:
+        self._metrics["admitted"] += 1
+        self._metrics["wait_seconds_total"] += waited
+        self._metrics["max_wait_seconds"] = max(self._metrics["max_wait_seconds"], waited)
+        self._recent_waits.append(waited)
+        return time.monotonic()
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        if self._avg_hold_seconds is None:
+            return settings.LLM_RETRY_AFTER_SECONDS
+        backlog = (len(self._queue) + 1) * self._avg_hold_seconds / self.limit
+        return max(settings.LLM_RETRY_AFTER_SECONDS, math.ceil(backlog))
+
+    async def priority_for(self, user_id: int) -> int:
+        """Queue priority from recent crises and the latest assessment (cached per user)"""
+        priority = self._priorities.get(user_id)
+        if priority is None:
+            priority = await self._load_priority(user_id)
+            self._priorities.set(user_id, priority)
+        return priority
+
+    async def _load_priority(self, user_id: int) -> int:
+        since = datetime.now(timezone.utc) - timedelta(seconds=settings.LLM_PRIORITY_CRISIS_WINDOW_SECONDS)
+        async with AsyncSessionLocal() as db:
+            recent_crisis = await db.scalar(
+                select(CrisisLog.id)
+                .where(CrisisLog.user_id == user_id)
+                .where(CrisisLog.created_at >= since)
+                .limit(1)
+            )
+            if recent_crisis is not None:
+                return PRIORITY_URGENT
+
+            risk_level = await db.scalar(
+                select(Assessment.risk_level)
+                .where(Assessment.user_id == user_id)
+                .order_by(Assessment.created_at.desc())
+                .limit(1)
+            )
+
+        if risk_level in HIGH_RISK_LEVELS:
+            return PRIORITY_URGENT
+        if risk_level == RiskLevel.MODERATE:
+            return PRIORITY_ELEVATED
+        return PRIORITY_NORMAL
+
+    def note_crisis(self, user_id: int):
+        """Serve this user first from now on (the crisis log is written asynchronously)"""
+        self._priorities.set(user_id, PRIORITY_URGENT)
+
+    def note_assessment(self, user_id: int):
+        """Recompute priority on the next request after a new assessment"""
+        self._priorities.pop(user_id)
+
+    def stats(self) -> Dict:
+        """Slot usage, queue depth and wait times"""
+        admitted = self._metrics["admitted"]
+        waits = sorted(self._recent_waits)
+        depth_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._queue:
+            if not future.done():
+                depth_by_priority[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return {
+            "max_in_flight": self.limit,
+            "in_flight": self._in_flight,
+            "max_queue_size": self.max_queue,
+            "queue_depth": len(self._queue),
+            "queue_depth_by_priority": depth_by_priority,
+            **self._metrics,
+            "avg_wait_seconds": self._metrics["wait_seconds_total"] / admitted if admitted else 0.0,
+            "p50_wait_seconds": waits[len(waits) // 2] if waits else 0.0,
+            "p95_wait_seconds": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "avg_hold_seconds": self._avg_hold_seconds or 0.0,
+            "retry_after_seconds": self.retry_after()
+        }
+
+
+# Global instance
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,145 @@
+"""
+Application-scoped HTTP client for Ollama
+
+One keep-alive connection pool per worker, created in the lifespan hook and
+closed on shutdown. max_connections (OLLAMA_MAX_CONNECTIONS) doubles as the
+concurrency ceiling in front of the LLM: callers beyond it wait for a pooled
+connection for up to OLLAMA_POOL_TIMEOUT_SECONDS.
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+import logging
+import time
+
+import httpx
+
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaClient:
+    """Pooled /api/generate client with request and pool metrics"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._metrics = {
+            "requests": 0,
+            "stream_requests": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "errors": 0,
+            "pool_timeouts": 0,
+            "connect_errors": 0,
+            "request_seconds_total": 0.0
+        }
+
+    async def start(self):
+        """Create the shared client"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=settings.OLLAMA_API_URL,
+                timeout=httpx.Timeout(
+                    connect=settings.OLLAMA_CONNECT_TIMEOUT_SECONDS,
+                    read=settings.OLLAMA_READ_TIMEOUT_SECONDS,
+                    write=settings.OLLAMA_CONNECT_TIMEOUT_SECONDS,
+                    pool=settings.OLLAMA_POOL_TIMEOUT_SECONDS
+                ),
+                limits=httpx.Limits(
+                    max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                    keepalive_expiry=settings.OLLAMA_KEEPALIVE_SECONDS
+                )
+            )
+            logger.info(f"✅ Ollama client ready ({settings.OLLAMA_MAX_CONNECTIONS} connections)")
+
+    async def close(self):
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("Ollama client not started. Call start() in the lifespan hook first.")
+        return self._client
+
+    async def generate(self, payload: Dict, timeout: Optional[float] = None) -> httpx.Response:
+        """POST /api/generate (non-streaming); timeout overrides the read timeout"""
+        request_timeout = httpx.USE_CLIENT_DEFAULT
+        if timeout is not None:
+            request_timeout = httpx.Timeout(
+                connect=settings.OLLAMA_CONNECT_TIMEOUT_SECONDS,
+                read=timeout,
+                write=settings.OLLAMA_CONNECT_TIMEOUT_SECONDS,
+                pool=min(timeout, settings.OLLAMA_POOL_TIMEOUT_SECONDS)
+            )
+
+        self._begin()
+        started = time.perf_counter()
+        try:
+            return await self.client.post("/api/generate", json=payload, timeout=request_timeout)
+        except Exception as e:
+            self._record_error(e)
+            raise
+        finally:
+            self._end(started)
+
+    @asynccontextmanager
+    async def stream(self, payload: Dict) -> AsyncIterator[httpx.Response]:
+        """POST /api/generate with a streamed response body"""
+        self._begin()
+        self._metrics["stream_requests"] += 1
+        started = time.perf_counter()
+        caller_error = False
+        try:
+            async with self.client.stream("POST", "/api/generate", json=payload) as response:
+                try:
+                    yield response
+                except Exception as e:
+                    # Failures reading the body are Ollama's; anything else is the caller's
+                    caller_error = not isinstance(e, httpx.HTTPError)
+                    raise
+        except Exception as e:
+            if not caller_error:
+                self._record_error(e)
+            raise
+        finally:
+            self._end(started)
+
+    def _begin(self):
+        self._metrics["requests"] += 1
+        self._metrics["in_flight"] += 1
+        self._metrics["peak_in_flight"] = max(self._metrics["peak_in_flight"], self._metrics["in_flight"])
+
+    def _end(self, started: float):
+        self._metrics["in_flight"] -= 1
+        self._metrics["request_seconds_total"] += time.perf_counter() - started
+
+    def _record_error(self, error: Exception):
+        self._metrics["errors"] += 1
+        if isinstance(error, httpx.PoolTimeout):
+            self._metrics["pool_timeouts"] += 1
+        elif isinstance(error, httpx.ConnectError):
+            self._metrics["connect_errors"] += 1
+
+    def _open_connections(self) -> Optional[int]:
+        """Connections currently held by the pool (httpcore internals, best effort)"""
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        return len(connections) if connections is not None else None
+
+    def stats(self) -> Dict:
+        """Request counters and pool occupancy"""
+        requests = self._metrics["requests"]
+        return {
+            "max_connections": settings.OLLAMA_MAX_CONNECTIONS,
+            "open_connections": self._open_connections() if self._client is not None else 0,
+            **self._metrics,
+            "avg_request_seconds": self._metrics["request_seconds_total"] / requests if requests else 0.0
+        }
+
+
+# Global instance
+ollama_client = OllamaClient()
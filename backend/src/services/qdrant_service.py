@@ -1,17 +1,69 @@
 """
 Qdrant vector database service
+
+Uses the asyncio client (REST, or gRPC with QDRANT_PREFER_GRPC) over one shared
+keep-alive connection pool. Request-path calls go through _call, which bounds
+in-flight concurrency and applies a per-call deadline.
 """
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    Distance,
+    VectorParams,
+    VectorParamsDiff,
+    HnswConfigDiff,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    Disabled,
+    SearchParams,
+    QuantizationSearchParams,
+    IntegerIndexParams,
+    IntegerIndexType,
+    KeywordIndexParams,
+    KeywordIndexType,
+    DatetimeIndexParams,
+    DatetimeIndexType,
+    PointStruct,
+    Filter,
+    FieldCondition,
+    MatchValue,
+    MatchAny,
+    FilterSelector
+)
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Optional
+from sqlalchemy import select, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.types import Integer
+from typing import Any, Awaitable, Callable, Iterable, List, Dict, Optional
+from datetime import datetime, timezone
+import asyncio
+import httpx
 import uuid
 import logging
 
+from src.models.database import AsyncSessionLocal
+from src.models.models import Conversation
+from src.services.embedding_batcher import EmbeddingBatcher
+from src.services.embedding_cache import EmbeddingCache
 from src.utils.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Namespace for deterministic point ids derived from conversation ids
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a4e-8d0b-4f5e-9a37-2c9e51b7d4a0")
+
+# Payload fields every search/scroll/delete filters on
+PAYLOAD_INDEXES = {
+    "conversation_id": IntegerIndexParams(type=IntegerIndexType.INTEGER, lookup=True, range=False),
+    "user_id": IntegerIndexParams(type=IntegerIndexType.INTEGER, lookup=True, range=False),
+    "session_id": KeywordIndexParams(type=KeywordIndexType.KEYWORD),
+    "sender": KeywordIndexParams(type=KeywordIndexType.KEYWORD),
+    "created_at": DatetimeIndexParams(type=DatetimeIndexType.DATETIME)
+}
+
+# Payload fields kept in slim mode (QDRANT_SLIM_PAYLOAD)
+SLIM_PAYLOAD_FIELDS = ["conversation_id", "user_id", "session_id", "sender", "created_at"]
+
 
 class QdrantService:
     """Service for managing Qdrant vector database operations"""
@@ -21,36 +73,222 @@ class QdrantService:
         self.encoder = None
         self.collection_name = settings.QDRANT_COLLECTION_NAME
         self.embedding_dim = settings.QDRANT_EMBEDDING_DIM
+        self.embedding_batcher = EmbeddingBatcher()
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        self._inflight = asyncio.Semaphore(settings.QDRANT_MAX_CONCURRENT_REQUESTS)
+        self._metrics = {
+            "calls": 0,
+            "in_flight": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "call_seconds_total": 0.0
+        }
+    
+    def connect(self) -> AsyncQdrantClient:
+        """Create the shared Qdrant client (no encoder); used directly by offline jobs"""
+        if self.client is None:
+            keepalive_ms = settings.QDRANT_KEEPALIVE_SECONDS * 1000
+            self.client = AsyncQdrantClient(
+                url=settings.QDRANT_URL,
+                api_key=settings.QDRANT_API_KEY if settings.QDRANT_API_KEY else None,
+                prefer_grpc=settings.QDRANT_PREFER_GRPC,
+                grpc_port=settings.QDRANT_GRPC_PORT,
+                timeout=settings.QDRANT_TIMEOUT_SECONDS,
+                grpc_options={
+                    "grpc.keepalive_time_ms": keepalive_ms,
+                    "grpc.keepalive_timeout_ms": 10000,
+                    "grpc.keepalive_permit_without_calls": 1,
+                    "grpc.http2.max_pings_without_data": 0
+                },
+                limits=httpx.Limits(
+                    max_connections=settings.QDRANT_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.QDRANT_MAX_CONNECTIONS,
+                    keepalive_expiry=settings.QDRANT_KEEPALIVE_SECONDS
+                )
+            )
+            transport = "gRPC" if settings.QDRANT_PREFER_GRPC else "REST"
+            logger.info(f"✅ Qdrant client connected over {transport}")
+        return self.client
+    
+    async def _call(
+        self,
+        method: Callable[..., Awaitable[Any]],
+        *args,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> Any:
+        """Run one client call under the in-flight limit and a deadline"""
+        async with self._inflight:
+            self._metrics["calls"] += 1
+            self._metrics["in_flight"] += 1
+            started = asyncio.get_running_loop().time()
+            try:
+                return await asyncio.wait_for(
+                    method(*args, **kwargs),
+                    timeout=timeout or settings.QDRANT_REQUEST_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                self._metrics["timeouts"] += 1
+                raise
+            except Exception:
+                self._metrics["errors"] += 1
+                raise
+            finally:
+                self._metrics["in_flight"] -= 1
+                self._metrics["call_seconds_total"] += asyncio.get_running_loop().time() - started
+    
+    @staticmethod
+    def _hnsw_config() -> HnswConfigDiff:
+        """HNSW parameters from settings"""
+        return HnswConfigDiff(
+            m=settings.QDRANT_HNSW_M,
+            ef_construct=settings.QDRANT_HNSW_EF_CONSTRUCT,
+            payload_m=settings.QDRANT_HNSW_PAYLOAD_M,
+            on_disk=settings.QDRANT_HNSW_ON_DISK
+        )
+    
+    @staticmethod
+    def _quantization_config() -> Optional[ScalarQuantization]:
+        """Scalar int8 quantization from settings, or None when disabled"""
+        if settings.QDRANT_QUANTIZATION != "int8":
+            return None
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                quantile=settings.QDRANT_QUANTIZATION_QUANTILE,
+                always_ram=settings.QDRANT_QUANTIZATION_ALWAYS_RAM
+            )
+        )
+    
+    @staticmethod
+    def _search_params() -> Optional[SearchParams]:
+        """Per-query HNSW ef and quantization rescoring"""
+        quantization = None
+        if settings.QDRANT_QUANTIZATION == "int8":
+            quantization = QuantizationSearchParams(
+                rescore=True,
+                oversampling=settings.QDRANT_SEARCH_OVERSAMPLING
+            )
+        hnsw_ef = settings.QDRANT_SEARCH_HNSW_EF or None
+        if quantization is None and hnsw_ef is None:
+            return None
+        return SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
+    
+    async def create_collection(self, collection_name: str):
+        """Create a conversation collection with the configured storage and payload indexes"""
+        await self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(
+                size=self.embedding_dim,
+                distance=Distance.COSINE,
+                on_disk=settings.QDRANT_VECTORS_ON_DISK
+            ),
+            hnsw_config=self._hnsw_config(),
+            quantization_config=self._quantization_config(),
+            on_disk_payload=settings.QDRANT_PAYLOAD_ON_DISK
+        )
+        await self.ensure_payload_indexes(collection_name)
+        logger.info(f"✅ Created Qdrant collection: {collection_name}")
+    
+    async def ensure_payload_indexes(self, collection_name: str, existing: Optional[Dict] = None):
+        """Create any missing payload indexes"""
+        existing = existing or {}
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name in existing:
+                continue
+            await self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema
+            )
+            logger.info(f"✅ Created payload index {collection_name}.{field_name}")
+    
+    async def migrate_collection(self, collection_name: str):
+        """
+        Bring an existing collection in line with the configured HNSW,
+        quantization and on-disk settings, and add missing payload indexes.
+        Qdrant rebuilds segments in the background. Vector size or distance
+        changes cannot be applied in place; run src.jobs.reindex_qdrant.
+        """
+        info = await self.client.get_collection(collection_name)
+        vectors = info.config.params.vectors
+        
+        if vectors.size != self.embedding_dim or vectors.distance != Distance.COSINE:
+            logger.warning(
+                f"⚠️ Collection {collection_name} has {vectors.size}d/{vectors.distance} vectors, expected "
+                f"{self.embedding_dim}d/Cosine; rebuild it with python -m src.jobs.reindex_qdrant"
+            )
+        
+        hnsw = info.config.hnsw_config
+        desired_hnsw = self._hnsw_config()
+        hnsw_changed = (
+            hnsw.m != desired_hnsw.m
+            or hnsw.ef_construct != desired_hnsw.ef_construct
+            or hnsw.payload_m != desired_hnsw.payload_m
+            or bool(hnsw.on_disk) != desired_hnsw.on_disk
+        )
+        
+        quantization = info.config.quantization_config
+        desired_quantization = self._quantization_config()
+        if desired_quantization is None:
+            quantization_changed = quantization is not None
+        else:
+            quantization_changed = (
+                not isinstance(quantization, ScalarQuantization)
+                or quantization.scalar.type != desired_quantization.scalar.type
+                or quantization.scalar.quantile != desired_quantization.scalar.quantile
+                or bool(quantization.scalar.always_ram) != desired_quantization.scalar.always_ram
+            )
+        
+        on_disk_changed = bool(vectors.on_disk) != settings.QDRANT_VECTORS_ON_DISK
+        
+        if hnsw_changed or quantization_changed or on_disk_changed:
+            await self.client.update_collection(
+                collection_name=collection_name,
+                vectors_config={"": VectorParamsDiff(on_disk=settings.QDRANT_VECTORS_ON_DISK)} if on_disk_changed else None,
+                hnsw_config=desired_hnsw if hnsw_changed else None,
+                quantization_config=(desired_quantization or Disabled.DISABLED) if quantization_changed else None
+            )
+            logger.info(
+                f"✅ Migrated Qdrant collection {collection_name} "
+                f"(hnsw={hnsw_changed}, quantization={quantization_changed}, on_disk={on_disk_changed})"
+            )
+        
+        await self.ensure_payload_indexes(collection_name, existing=info.payload_schema)
+    
+    async def resolve_alias(self, alias_name: str) -> Optional[str]:
+        """Collection an alias currently points to, or None"""
+        for alias in (await self.client.get_aliases()).aliases:
+            if alias.alias_name == alias_name:
+                return alias.collection_name
+        return None
     
     async def initialize_collections(self):
         """Initialize Qdrant client and create collections"""
         try:
             # Initialize Qdrant client
-            self.client = QdrantClient(
-                url=settings.QDRANT_URL,
-                api_key=settings.QDRANT_API_KEY if settings.QDRANT_API_KEY else None,
-                timeout=30
-            )
+            self.connect()
             
             # Initialize sentence transformer for embeddings
-            self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
+            self.encoder = SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
+            self.embedding_cache = EmbeddingCache(settings.EMBEDDING_MODEL_NAME, self.embedding_dim)
+            if settings.EMBEDDING_BATCHING_ENABLED:
+                self.embedding_batcher.start(self.encoder)
             
-            # Check if collection exists
-            collections = self.client.get_collections().collections
+            # Check if collection exists (directly, or as an alias after a reindex)
+            collections = (await self.client.get_collections()).collections
             collection_names = [col.name for col in collections]
+            aliased = await self.resolve_alias(self.collection_name)
             
-            if self.collection_name not in collection_names:
+            if aliased is not None:
+                logger.info(f"✅ Qdrant alias {self.collection_name} -> {aliased}")
+                await self.migrate_collection(aliased)
+            elif self.collection_name not in collection_names:
                 # Create collection
-                self.client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=VectorParams(
-                        size=self.embedding_dim,
-                        distance=Distance.COSINE
-                    )
-                )
-                logger.info(f"✅ Created Qdrant collection: {self.collection_name}")
+                await self.create_collection(self.collection_name)
             else:
                 logger.info(f"✅ Qdrant collection already exists: {self.collection_name}")
+                await self.migrate_collection(self.collection_name)
             
         except Exception as e:
             logger.error(f"❌ Failed to initialize Qdrant: {e}")
@@ -61,54 +299,137 @@ class QdrantService:
         if not self.encoder:
             raise RuntimeError("Encoder not initialized. Call initialize_collections first.")
         
-        embedding = self.encoder.encode(text, convert_to_numpy=True)
-        return embedding.tolist()
+        cached = self.embedding_cache.get(text)
+        if cached is not None:
+            return cached
+        
+        embedding = self.encoder.encode(text, convert_to_numpy=True).tolist()
+        self.embedding_cache.put(text, embedding)
+        return embedding
     
-    async def add_conversation(
-        self,
+    async def create_embedding_async(self, text: str) -> List[float]:
+        """Create vector embedding without blocking the event loop (micro-batched across requests)"""
+        if not self.encoder:
+            raise RuntimeError("Encoder not initialized. Call initialize_collections first.")
+        
+        if not settings.EMBEDDING_BATCHING_ENABLED:
+            return self.create_embedding(text)
+        
+        cached = self.embedding_cache.get(text)
+        if cached is not None:
+            return cached
+        
+        embedding = await self.embedding_batcher.encode(text)
+        self.embedding_cache.put(text, embedding)
+        return embedding
+    
+    async def close(self):
+        """Stop background embedding work and close the Qdrant connections"""
+        self.embedding_batcher.stop()
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+    
+    async def upsert_conversations(self, conversations: List[Dict]) -> List[str]:
+        """
+        Embed and upsert many conversation messages with a single Qdrant request.
+        Each item needs conversation_id, user_id, session_id, message_text and
+        sender (metadata and created_at optional). Point ids are derived from the conversation
+        id, so retrying a batch overwrites rather than duplicates.
+        Returns the point ids in input order.
+        """
+        if not conversations:
+            return []
+        
+        # Concurrent encodes coalesce in the embedding batcher (and hit the cache)
+        vectors = await asyncio.gather(*[
+            self.create_embedding_async(conv["message_text"]) for conv in conversations
+        ])
+        
+        point_ids = [self.point_id_for(conv["conversation_id"]) for conv in conversations]
+        points = [
+            PointStruct(
+                id=point_id,
+                vector=vector,
+                payload=self._conversation_payload(
+                    conv["conversation_id"],
+                    conv["user_id"],
+                    conv["session_id"],
+                    conv["message_text"],
+                    conv["sender"],
+                    conv.get("metadata"),
+                    conv.get("created_at")
+                )
+            )
+            for conv, point_id, vector in zip(conversations, point_ids, vectors)
+        ]
+        
+        await self._call(self.client.upsert, collection_name=self.collection_name, points=points)
+        
+        logger.info(f"✅ Upserted {len(points)} conversations to Qdrant")
+        return point_ids
+    
+    @staticmethod
+    def point_id_for(conversation_id: int) -> str:
+        """Deterministic Qdrant point id for a conversation row"""
+        return str(uuid.uuid5(POINT_ID_NAMESPACE, f"conversation:{conversation_id}"))
+    
+    @staticmethod
+    def _conversation_payload(
         conversation_id: int,
         user_id: int,
         session_id: str,
         message_text: str,
         sender: str,
-        metadata: Optional[Dict] = None
-    ) -> str:
-        """Add conversation message to vector database"""
-        try:
-            # Create embedding
-            vector = self.create_embedding(message_text)
-            
-            # Generate unique point ID
-            point_id = str(uuid.uuid4())
-            
-            # Prepare payload
-            payload = {
-                "conversation_id": conversation_id,
-                "user_id": user_id,
-                "session_id": session_id,
-                "message_text": message_text,
-                "sender": sender,
-                **(metadata or {})
-            }
-            
-            # Insert into Qdrant
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=[
-                    PointStruct(
-                        id=point_id,
-                        vector=vector,
-                        payload=payload
-                    )
-                ]
+        metadata: Optional[Dict] = None,
+        created_at: Optional[datetime] = None
+    ) -> Dict:
+        """Payload stored with each conversation point (ids and filter fields only in slim mode)"""
+        created_at = created_at or datetime.now(timezone.utc)
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        
+        payload = {
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "session_id": session_id,
+            "sender": sender,
+            "created_at": created_at.isoformat()
+        }
+        if not settings.QDRANT_SLIM_PAYLOAD:
+            payload["message_text"] = message_text
+            payload.update(metadata or {})
+        return payload
+    
+    @staticmethod
+    async def fetch_conversation_texts(conversation_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Message text and sender for many conversations with one WHERE id = ANY(...) query"""
+        ids = list({conversation_id for conversation_id in conversation_ids if conversation_id is not None})
+        if not ids:
+            return {}
+        
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Conversation.id, Conversation.message_text, Conversation.sender)
+                .where(Conversation.id == any_(bindparam("ids", ids, type_=ARRAY(Integer))))
             )
-            
-            logger.info(f"✅ Added conversation {conversation_id} to Qdrant with ID: {point_id}")
-            return point_id
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to add conversation to Qdrant: {e}")
-            raise
+            return {
+                row.id: {"message_text": row.message_text, "sender": row.sender}
+                for row in result.all()
+            }
+    
+    async def _hydrate(self, items: List[Dict]) -> List[Dict]:
+        """Fill message_text from Postgres in slim mode, dropping rows deleted there"""
+        if not settings.QDRANT_SLIM_PAYLOAD or not items:
+            return items
+        
+        texts = await self.fetch_conversation_texts(item["conversation_id"] for item in items)
+        hydrated = []
+        for item in items:
+            row = texts.get(item["conversation_id"])
+            if row is not None:
+                hydrated.append({**item, **row})
+        return hydrated
     
     async def search_similar_conversations(
         self,
@@ -119,24 +440,26 @@ class QdrantService:
         """Search for similar conversations"""
         try:
             # Create query embedding
-            query_vector = self.create_embedding(query_text)
+            query_vector = await self.create_embedding_async(query_text)
             
             # Prepare filter
             search_filter = None
             if user_id:
-                search_filter = {
-                    "must": [
-                        {"key": "user_id", "match": {"value": user_id}}
-                    ]
-                }
+                search_filter = Filter(
+                    must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))]
+                )
             
             # Search
-            results = self.client.search(
+            response = await self._call(
+                self.client.query_points,
                 collection_name=self.collection_name,
-                query_vector=query_vector,
+                query=query_vector,
                 query_filter=search_filter,
+                search_params=self._search_params(),
+                with_payload=SLIM_PAYLOAD_FIELDS if settings.QDRANT_SLIM_PAYLOAD else True,
                 limit=limit
             )
+            results = response.points
             
             # Format results
             formatted_results = [
@@ -150,57 +473,65 @@ class QdrantService:
                 for hit in results
             ]
             
-            return formatted_results
+            return await self._hydrate(formatted_results)
             
         except Exception as e:
             logger.error(f"❌ Failed to search Qdrant: {e}")
             return []
     
-    async def get_session_context(self, session_id: str, limit: int = 10) -> List[Dict]:
-        """Get recent conversations from a session"""
+    async def delete_user_conversations(self, user_id: int):
+        """Delete all conversations for a user"""
         try:
-            results = self.client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter={
-                    "must": [
-                        {"key": "session_id", "match": {"value": session_id}}
-                    ]
-                },
-                limit=limit
+            await self._delete_by_filter(
+                Filter(must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))])
             )
-            
-            conversations = [
-                {
-                    "message_text": point.payload.get("message_text"),
-                    "sender": point.payload.get("sender")
-                }
-                for point in results[0]
-            ]
-            
-            return conversations
+            logger.info(f"✅ Deleted all conversations for user {user_id}")
             
         except Exception as e:
-            logger.error(f"❌ Failed to get session context: {e}")
-            return []
+            logger.error(f"❌ Failed to delete user conversations: {e}")
+            raise
     
-    async def delete_user_conversations(self, user_id: int):
-        """Delete all conversations for a user"""
+    async def delete_session_conversations(self, user_id: int, session_id: str):
+        """Delete all conversations in one of a user's sessions"""
         try:
-            self.client.delete(
-                collection_name=self.collection_name,
-                points_selector={
-                    "filter": {
-                        "must": [
-                            {"key": "user_id", "match": {"value": user_id}}
-                        ]
-                    }
-                }
+            await self._delete_by_filter(
+                Filter(must=[
+                    FieldCondition(key="user_id", match=MatchValue(value=user_id)),
+                    FieldCondition(key="session_id", match=MatchValue(value=session_id))
+                ])
             )
-            logger.info(f"✅ Deleted all conversations for user {user_id}")
+            logger.info(f"✅ Deleted conversations for session {session_id}")
             
         except Exception as e:
-            logger.error(f"❌ Failed to delete user conversations: {e}")
+            logger.error(f"❌ Failed to delete session conversations: {e}")
             raise
+    
+    async def delete_conversations_by_ids(self, conversation_ids: List[int]):
+        """Delete the points of these conversations (matched on payload, so legacy uuid4 points go too)"""
+        if not conversation_ids:
+            return
+        await self._delete_by_filter(
+            Filter(must=[FieldCondition(key="conversation_id", match=MatchAny(any=list(conversation_ids)))])
+        )
+    
+    async def _delete_by_filter(self, points_filter: Filter):
+        """One server-side filtered delete (management deadline, not the request-path one)"""
+        await self._call(
+            self.client.delete,
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=points_filter),
+            timeout=settings.QDRANT_TIMEOUT_SECONDS
+        )
+    
+    def stats(self) -> Dict:
+        """Client call counters"""
+        calls = self._metrics["calls"]
+        return {
+            "transport": "grpc" if settings.QDRANT_PREFER_GRPC else "rest",
+            "max_concurrent_requests": settings.QDRANT_MAX_CONCURRENT_REQUESTS,
+            **self._metrics,
+            "avg_call_seconds": self._metrics["call_seconds_total"] / calls if calls else 0.0
+        }
 
 
 # Global instance
@@ -0,0 +1,232 @@
+"""
+Scheduled retention sweeper
+
+Enforces CONVERSATION_RETENTION_DAYS and CRISIS_LOG_RETENTION_DAYS. Expired rows
+are removed oldest-first in RETENTION_BATCH_SIZE batches, one short transaction
+each with a pause in between, so no statement holds locks for long and
+autovacuum can keep up with the dead tuples. Conversation deletes also
+decrement ChatSession.message_count, and each batch's Qdrant points are removed
+by conversation_id (which also catches points written before payloads carried
+created_at). Guardian alerts outlive their crisis logs; their crisis_log_id is
+cleared before the log is deleted.
+
+A Postgres advisory lock makes sure only one worker sweeps at a time.
+"""
+from sqlalchemy import select, update, delete, bindparam, func, text
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import time
+
+from src.models.database import AsyncSessionLocal, engine
+from src.models.models import Conversation, ChatSession, CrisisLog, GuardianAlert
+from src.services.qdrant_service import qdrant_service
+from src.services.session_context import session_context_cache
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# pg_try_advisory_lock key shared by every worker
+ADVISORY_LOCK_KEY = 0x4E57_5245_5445  # "NWRETE"
+
+_decrement_message_count = (
+    update(ChatSession.__table__)
+    .where(ChatSession.__table__.c.session_id == bindparam("target_session_id"))
+    .values(message_count=func.greatest(ChatSession.__table__.c.message_count - bindparam("removed"), 0))
+)
+
+
+class RetentionSweeper:
+    """Periodic batched delete of expired conversations and crisis logs"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._manual_task: Optional[asyncio.Task] = None
+        self.last_sweep: Optional[Dict] = None
+        self._metrics = {
+            "sweeps": 0,
+            "skipped_locked": 0,
+            "conversations_deleted": 0,
+            "crisis_logs_deleted": 0,
+            "sessions_deleted": 0,
+            "qdrant_errors": 0
+        }
+
+    async def start(self):
+        """Start the sweep loop"""
+        if settings.RETENTION_SWEEP_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"✅ Retention sweeper started (every {settings.RETENTION_SWEEP_INTERVAL_SECONDS}s)")
+
+    async def stop(self):
+        """Stop the loop; a sweep in progress stops between batches"""
+        for task in (self._task, self._manual_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._manual_task = None
+
+    def trigger(self) -> bool:
+        """Start an on-demand sweep in the background; False if one is already running here"""
+        if self._manual_task is not None and not self._manual_task.done():
+            return False
+        self._manual_task = asyncio.create_task(self._run_once())
+        return True
+
+    async def _run_once(self):
+        try:
+            await self.sweep()
+        except Exception as e:
+            logger.error(f"❌ Retention sweep failed: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Retention sweep failed: {e}")
+            await asyncio.sleep(settings.RETENTION_SWEEP_INTERVAL_SECONDS)
+
+    async def sweep(self) -> Optional[Dict]:
+        """Run one sweep if no other worker holds the lock; returns rows deleted"""
+        async with engine.connect() as lock_conn:
+            locked = await lock_conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            await lock_conn.commit()
+            if not locked:
+                self._metrics["skipped_locked"] += 1
+                return None
+
+            try:
+                started = time.monotonic()
+                now = datetime.now(timezone.utc)
+                report = {"conversations_deleted": 0, "sessions_deleted": 0, "crisis_logs_deleted": 0}
+
+                if settings.CONVERSATION_RETENTION_DAYS > 0:
+                    cutoff = now - timedelta(days=settings.CONVERSATION_RETENTION_DAYS)
+                    report["conversations_deleted"] = await self._sweep_conversations(cutoff)
+                    report["sessions_deleted"] = await self._delete_empty_sessions(cutoff)
+
+                if settings.CRISIS_LOG_RETENTION_DAYS > 0:
+                    cutoff = now - timedelta(days=settings.CRISIS_LOG_RETENTION_DAYS)
+                    report["crisis_logs_deleted"] = await self._sweep_crisis_logs(cutoff)
+
+                report["duration_seconds"] = round(time.monotonic() - started, 3)
+                report["finished_at"] = datetime.now(timezone.utc).isoformat()
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                await lock_conn.commit()
+
+        self._metrics["sweeps"] += 1
+        for key in ("conversations_deleted", "sessions_deleted", "crisis_logs_deleted"):
+            self._metrics[key] += report[key]
+        self.last_sweep = report
+        logger.info(f"✅ Retention sweep: {report}")
+        return report
+
+    async def _sweep_conversations(self, cutoff: datetime) -> int:
+        """Delete expired conversations oldest-first and fix up session message counts"""
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                batch = (
+                    select(Conversation.id)
+                    .where(Conversation.created_at < cutoff)
+                    .order_by(Conversation.id)
+                    .limit(settings.RETENTION_BATCH_SIZE)
+                    .scalar_subquery()
+                )
+                result = await db.execute(
+                    delete(Conversation)
+                    .where(Conversation.id.in_(batch))
+                    .returning(Conversation.id, Conversation.user_id, Conversation.session_id)
+                )
+                rows = result.all()
+                removed = Counter((user_id, session_id) for _, user_id, session_id in rows)
+
+                if removed:
+                    await db.execute(
+                        _decrement_message_count,
+                        [
+                            {"target_session_id": session_id, "removed": count}
+                            for (_, session_id), count in removed.items()
+                        ]
+                    )
+                await db.commit()
+
+            # Expired turns must not be fed back to the LLM from the context buffers
+            for user_id, session_id in removed:
+                session_context_cache.invalidate(user_id, [session_id])
+
+            await self._delete_points([conversation_id for conversation_id, _, _ in rows])
+
+            deleted = len(rows)
+            total += deleted
+            if deleted < settings.RETENTION_BATCH_SIZE:
+                return total
+            await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_SECONDS)
+
+    async def _delete_points(self, conversation_ids: List[int]):
+        """Remove a batch's vectors; a Qdrant outage must not hold up the rest of the sweep"""
+        try:
+            await qdrant_service.delete_conversations_by_ids(conversation_ids)
+        except Exception as e:
+            self._metrics["qdrant_errors"] += 1
+            logger.error(f"❌ Retention sweep could not delete {len(conversation_ids)} Qdrant points: {e}")
+
+    async def _delete_empty_sessions(self, cutoff: datetime) -> int:
+        """Remove sessions whose every message has expired"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(ChatSession)
+                .where(ChatSession.message_count <= 0)
+                .where(func.coalesce(ChatSession.last_message_at, ChatSession.started_at) < cutoff)
+            )
+            await db.commit()
+            return result.rowcount
+
+    async def _sweep_crisis_logs(self, cutoff: datetime) -> int:
+        """Delete expired crisis logs, detaching any guardian alerts that reference them"""
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(CrisisLog.id)
+                    .where(CrisisLog.created_at < cutoff)
+                    .order_by(CrisisLog.id)
+                    .limit(settings.RETENTION_BATCH_SIZE)
+                    .with_for_update(skip_locked=True)
+                )
+                ids = result.scalars().all()
+
+                if ids:
+                    await db.execute(
+                        update(GuardianAlert)
+                        .where(GuardianAlert.crisis_log_id.in_(ids))
+                        .values(crisis_log_id=None)
+                    )
+                    await db.execute(delete(CrisisLog).where(CrisisLog.id.in_(ids)))
+                await db.commit()
+
+            total += len(ids)
+            if len(ids) < settings.RETENTION_BATCH_SIZE:
+                return total
+            await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_SECONDS)
+
+    def stats(self) -> Dict:
+        """Sweep counters and the last sweep's report"""
+        return {
+            "running": self._task is not None,
+            "manual_sweep_running": self._manual_task is not None and not self._manual_task.done(),
+            **self._metrics,
+            "last_sweep": self.last_sweep
+        }
+
+
+# Global instance
+retention_sweeper = RetentionSweeper()
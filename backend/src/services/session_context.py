@@ -0,0 +1,82 @@
+"""
+Per-session recent chat context
+
+Keeps the last SESSION_CONTEXT_TURNS messages of each active session in a ring
+buffer, with LRU eviction across sessions. A miss is warmed from Postgres in
+created_at order; handlers append turns after they commit, so building the LLM
+context is a memory read that is always in conversation order.
+"""
+from collections import deque
+from sqlalchemy import select
+from typing import Dict, Iterable, List
+import logging
+
+from src.models.database import AsyncSessionLocal
+from src.models.models import Conversation
+from src.utils.cache import TTLCache
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SessionContextCache:
+    """LRU of per-session ring buffers of (conversation_id, sender, message_text)"""
+
+    def __init__(self):
+        self.turns = settings.SESSION_CONTEXT_TURNS
+        self._buffers = TTLCache(
+            max_entries=settings.SESSION_CONTEXT_MAX_SESSIONS,
+            ttl_seconds=settings.SESSION_CONTEXT_TTL_SECONDS
+        )
+        self.warms = 0
+
+    async def get(self, user_id: int, session_id: str) -> List[Dict]:
+        """Recent messages for a session, oldest first"""
+        key = (user_id, session_id)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = await self._warm(user_id, session_id)
+            self._buffers.set(key, buffer)
+
+        return [
+            {"message_text": message_text, "sender": sender}
+            for _, sender, message_text in buffer
+        ]
+
+    async def _warm(self, user_id: int, session_id: str) -> deque:
+        """Load the newest turns for a session from Postgres in a short session of its own"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Conversation.id, Conversation.sender, Conversation.message_text)
+                .where(Conversation.session_id == session_id)
+                .where(Conversation.user_id == user_id)
+                .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+                .limit(self.turns)
+            )
+            rows = [tuple(row) for row in result.all()]
+        self.warms += 1
+        return deque(reversed(rows), maxlen=self.turns)
+
+    def append(self, user_id: int, session_id: str, conversation_id: int, sender: str, message_text: str):
+        """Record a committed turn; sessions not in the cache are warmed on next read"""
+        # Writes don't count as lookups or keep an idle session alive
+        buffer = self._buffers.peek((user_id, session_id))
+        if buffer is None:
+            return
+        # A warm that ran after the commit already holds this row
+        if buffer and buffer[-1][0] >= conversation_id:
+            return
+        buffer.append((conversation_id, sender, message_text))
+
+    def invalidate(self, user_id: int, session_ids: Iterable[str]):
+        """Drop cached sessions (after deletes)"""
+        for session_id in session_ids:
+            self._buffers.pop((user_id, session_id))
+
+    def stats(self) -> Dict:
+        """Cache counters"""
+        return {"turns": self.turns, "warms": self.warms, **self._buffers.stats()}
+
+
+# Global instance
+session_context_cache = SessionContextCache()
@@ -0,0 +1,227 @@
+"""
+Background indexer draining the vector outbox into Qdrant
+
+Chat handlers insert a VectorOutbox row in the same transaction as each
+Conversation, so indexing work is never lost and never on the request path.
+This task leases pending rows in batches (a short UPDATE ... FOR UPDATE SKIP
+LOCKED transaction that bumps attempts and sets claimed_until, so several
+workers can run it at once), embeds them together and performs one bulk upsert
+per batch with no transaction open, then writes the vector_id values back in a
+second short transaction. Rows that fail VECTOR_INDEXER_MAX_ATTEMPTS times are
+dead letters: counted in stats and re-queued or purged from the admin API.
+"""
+from sqlalchemy import select, update, delete, func, or_
+from datetime import timedelta
+from typing import Dict, List, Optional
+import asyncio
+import logging
+
+from src.models.database import AsyncSessionLocal
+from src.models.models import Conversation, VectorOutbox
+from src.services.qdrant_service import qdrant_service
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class VectorIndexer:
+    """Outbox consumer that batches embedding and Qdrant upserts"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._dead_letters = 0
+        self._metrics = {
+            "batches": 0,
+            "indexed": 0,
+            "failed_batches": 0
+        }
+
+    def notify(self):
+        """Wake the indexer after new outbox rows are committed"""
+        self._wake.set()
+
+    async def start(self):
+        """Start the background drain loop"""
+        if self._task is None:
+            try:
+                await self.refresh_dead_letters()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not count vector outbox dead letters: {e}")
+            self._task = asyncio.create_task(self._run())
+            logger.info("✅ Vector indexer started")
+
+    async def stop(self):
+        """Stop the drain loop; pending rows stay in the outbox for the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Drain full batches back to back, otherwise wait for a notify or the poll interval"""
+        while True:
+            try:
+                indexed = await self.index_pending_batch()
+            except Exception as e:
+                logger.error(f"❌ Vector indexing batch failed: {e}")
+                indexed = 0
+
+            if indexed < settings.VECTOR_INDEXER_BATCH_SIZE:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._wake.wait(),
+                        timeout=settings.VECTOR_INDEXER_POLL_INTERVAL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+    async def index_pending_batch(self) -> int:
+        """Index one batch of outbox rows; returns how many were indexed"""
+        claimed = await self._claim_batch()
+        if not claimed:
+            return 0
+
+        outbox_ids = [row.outbox_id for row in claimed]
+        try:
+            point_ids = await qdrant_service.upsert_conversations([
+                {
+                    "conversation_id": row.id,
+                    "user_id": row.user_id,
+                    "session_id": row.session_id,
+                    "message_text": row.message_text,
+                    "sender": row.sender,
+                    "metadata": {"crisis_detected": bool(row.crisis_detected)} if row.sender == "user" else None,
+                    "created_at": row.created_at
+                }
+                for row in claimed
+            ])
+        except Exception as e:
+            self._metrics["failed_batches"] += 1
+            async with AsyncSessionLocal() as db:
+                # attempts was bumped by the claim; release the lease for a retry
+                await db.execute(
+                    update(VectorOutbox)
+                    .where(VectorOutbox.id.in_(outbox_ids))
+                    .values(claimed_until=None, last_error=str(e)[:500])
+                )
+                await db.commit()
+            await self.refresh_dead_letters()
+            raise
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Conversation.id).where(Conversation.id.in_([row.id for row in claimed]))
+            )
+            remaining = set(result.scalars().all())
+            updates = [
+                {"id": row.id, "vector_id": point_id}
+                for row, point_id in zip(claimed, point_ids)
+                if row.id in remaining
+            ]
+            if updates:
+                await db.execute(update(Conversation), updates)
+            await db.execute(delete(VectorOutbox).where(VectorOutbox.id.in_(outbox_ids)))
+            await db.commit()
+
+        # Deleted while we were upserting; their delete may have run before our upsert
+        orphaned = [row.id for row in claimed if row.id not in remaining]
+        if orphaned:
+            await qdrant_service.delete_conversations_by_ids(orphaned)
+
+        self._metrics["batches"] += 1
+        self._metrics["indexed"] += len(updates)
+        return len(claimed)
+
+    async def _claim_batch(self) -> List:
+        """Lease a batch of outbox rows (bumping attempts) and read their conversations in one short transaction"""
+        now = func.now()
+        async with AsyncSessionLocal() as db:
+            claimable = (
+                select(VectorOutbox.id)
+                .where(VectorOutbox.attempts < settings.VECTOR_INDEXER_MAX_ATTEMPTS)
+                .where(or_(VectorOutbox.claimed_until.is_(None), VectorOutbox.claimed_until < now))
+                .order_by(VectorOutbox.id.asc())
+                .limit(settings.VECTOR_INDEXER_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            result = await db.execute(
+                update(VectorOutbox)
+                .where(VectorOutbox.id.in_(claimable))
+                .values(
+                    attempts=VectorOutbox.attempts + 1,
+                    claimed_until=now + timedelta(seconds=settings.VECTOR_INDEXER_CLAIM_SECONDS)
+                )
+                .returning(VectorOutbox.id)
+            )
+            outbox_ids = result.scalars().all()
+            if not outbox_ids:
+                await db.commit()
+                return []
+
+            result = await db.execute(
+                select(
+                    VectorOutbox.id.label("outbox_id"),
+                    Conversation.id,
+                    Conversation.user_id,
+                    Conversation.session_id,
+                    Conversation.message_text,
+                    Conversation.sender,
+                    Conversation.crisis_detected,
+                    Conversation.created_at
+                )
+                .join(Conversation, Conversation.id == VectorOutbox.conversation_id)
+                .where(VectorOutbox.id.in_(outbox_ids))
+                .order_by(VectorOutbox.id.asc())
+            )
+            rows = result.all()
+            await db.commit()
+        return rows
+
+    async def refresh_dead_letters(self) -> int:
+        """Count outbox rows that exhausted VECTOR_INDEXER_MAX_ATTEMPTS"""
+        async with AsyncSessionLocal() as db:
+            count = await db.scalar(
+                select(func.count(VectorOutbox.id))
+                .where(VectorOutbox.attempts >= settings.VECTOR_INDEXER_MAX_ATTEMPTS)
+            )
+        if count and count > self._dead_letters:
+            logger.error(f"❌ {count} vector outbox rows exceeded {settings.VECTOR_INDEXER_MAX_ATTEMPTS} attempts")
+        self._dead_letters = count or 0
+        return self._dead_letters
+
+    async def requeue_dead_letters(self) -> int:
+        """Reset attempts on dead-lettered rows so the indexer retries them"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(VectorOutbox)
+                .where(VectorOutbox.attempts >= settings.VECTOR_INDEXER_MAX_ATTEMPTS)
+                .values(attempts=0, claimed_until=None)
+            )
+            await db.commit()
+        self._dead_letters = 0
+        self.notify()
+        return result.rowcount
+
+    async def purge_dead_letters(self) -> int:
+        """Drop dead-lettered rows (their conversations stay unindexed)"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(VectorOutbox).where(VectorOutbox.attempts >= settings.VECTOR_INDEXER_MAX_ATTEMPTS)
+            )
+            await db.commit()
+        self._dead_letters = 0
+        return result.rowcount
+
+    def stats(self) -> Dict:
+        """Batch counters and dead-letter count"""
+        return {"running": self._task is not None, **self._metrics, "dead_letters": self._dead_letters}
+
+
+# Global instance
+vector_indexer = VectorIndexer()
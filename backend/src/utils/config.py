@@ -35,11 +35,76 @@ class Settings(BaseSettings):
     QDRANT_URL: str = Field(default="http://localhost:6333", env="QDRANT_URL")
     QDRANT_API_KEY: str = Field(default="", env="QDRANT_API_KEY")
     QDRANT_COLLECTION_NAME: str = "neurowellca_conversations"
+    QDRANT_PREFER_GRPC: bool = False  # Use the gRPC port for point operations
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_TIMEOUT_SECONDS: int = 30  # Client-level default (collection management)
+    QDRANT_REQUEST_TIMEOUT_SECONDS: float = 5.0  # Deadline for each request-path call
+    QDRANT_MAX_CONCURRENT_REQUESTS: int = 32  # In-flight calls per worker
+    QDRANT_MAX_CONNECTIONS: int = 32  # REST connection pool size
+    QDRANT_KEEPALIVE_SECONDS: int = 30  # gRPC keep-alive ping / REST idle connection expiry
+    QDRANT_VECTORS_ON_DISK: bool = True  # Original vectors memory-mapped; quantized copies stay in RAM
+    QDRANT_PAYLOAD_ON_DISK: bool = True
+    QDRANT_QUANTIZATION: str = "int8"  # "int8" (scalar) or "none"
+    QDRANT_QUANTIZATION_QUANTILE: float = 0.99
+    QDRANT_QUANTIZATION_ALWAYS_RAM: bool = True
+    QDRANT_SEARCH_OVERSAMPLING: float = 2.0  # Candidates fetched per result before rescoring with originals
+    QDRANT_HNSW_M: int = 16
+    QDRANT_HNSW_EF_CONSTRUCT: int = 100
+    QDRANT_HNSW_PAYLOAD_M: int = 16  # Per-tenant (user_id) HNSW links
+    QDRANT_HNSW_ON_DISK: bool = False
+    QDRANT_SEARCH_HNSW_EF: int = 0  # 0 = server default
+    QDRANT_SLIM_PAYLOAD: bool = False  # Store ids/filter fields only; message text is read from Postgres
     QDRANT_EMBEDDING_DIM: int = 384  # sentence-transformers/all-MiniLM-L6-v2
+    EMBEDDING_MODEL_NAME: str = "all-MiniLM-L6-v2"
+    EMBEDDING_BATCHING_ENABLED: bool = True
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_WAIT_MS: int = 5
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 20000  # In-memory LRU tier
+    EMBEDDING_CACHE_DISK_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = "embedding_cache"
+    EMBEDDING_CACHE_DISK_CAPACITY: int = 100000  # Slots in the memory-mapped tier (~154 MB at 384 dims)
+    
+    # Per-session chat context cache
+    SESSION_CONTEXT_TURNS: int = 10  # Recent messages kept per session
+    SESSION_CONTEXT_MAX_SESSIONS: int = 10000
+    SESSION_CONTEXT_TTL_SECONDS: int = 300  # Bounds staleness when a session is served by several workers
+    
+    # Chat history deletion
+    DELETION_CHUNK_SIZE: int = 5000  # Conversation rows per DELETE statement
+    DELETION_CHUNK_PAUSE_SECONDS: float = 0.05
+    
+    # Vector indexing outbox
+    VECTOR_INDEXER_BATCH_SIZE: int = 64
+    VECTOR_INDEXER_POLL_INTERVAL_SECONDS: float = 2.0
+    VECTOR_INDEXER_MAX_ATTEMPTS: int = 10
+    VECTOR_INDEXER_CLAIM_SECONDS: int = 120  # Lease on claimed rows; expired leases are picked up again
+    
+    # Bulk Qdrant reindex (python -m src.jobs.reindex_qdrant)
+    REINDEX_BATCH_SIZE: int = 1024  # Rows fetched and embedded per batch
+    REINDEX_WINDOW_SIZE: int = 50000  # Rows per keyset window (one read transaction)
+    REINDEX_ENCODE_BATCH_SIZE: int = 128  # sentence-transformers batch size inside a worker
+    REINDEX_WORKERS: int = 1  # Embedding worker processes
+    REINDEX_UPSERT_BATCH_SIZE: int = 256  # Points per Qdrant upsert request
+    REINDEX_PARALLEL_UPSERTS: int = 4
+    REINDEX_CHECKPOINT_PATH: str = "reindex_qdrant_checkpoint.json"
     
     # Ollama LLM
     OLLAMA_API_URL: str = Field(default="http://localhost:11434", env="OLLAMA_API_URL")
     OLLAMA_MODEL: str = Field(default="llama3.2:3b", env="OLLAMA_MODEL")
+    OLLAMA_MAX_CONNECTIONS: int = 4  # Match OLLAMA_NUM_PARALLEL on the server
+    OLLAMA_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    OLLAMA_READ_TIMEOUT_SECONDS: float = 60.0  # Longest gap between bytes (whole reply when not streaming)
+    OLLAMA_POOL_TIMEOUT_SECONDS: float = 30.0  # Wait for a free connection
+    OLLAMA_KEEPALIVE_SECONDS: float = 60.0
+
+    # LLM admission control (per worker)
+    LLM_MAX_IN_FLIGHT: int = 0  # Concurrent generations; 0 = OLLAMA_MAX_CONNECTIONS
+    LLM_QUEUE_MAX_SIZE: int = 32  # Waiting requests beyond this are rejected with 503
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 20.0  # Longest wait for a slot before giving up
+    LLM_RETRY_AFTER_SECONDS: int = 5  # Minimum Retry-After on rejection
+    LLM_PRIORITY_CRISIS_WINDOW_SECONDS: int = 86400  # A crisis this recent puts the user first
+    LLM_PRIORITY_CACHE_MAX_USERS: int = 10000
+    LLM_PRIORITY_CACHE_TTL_SECONDS: int = 600
     
     # LSTM Model
     LSTM_MODEL_PATH: str = "src/ml_models/lstm_chat_summarizer.pth"
@@ -68,12 +133,51 @@ class Settings(BaseSettings):
     TWILIO_WHATSAPP_FROM: str = Field(default="", env="TWILIO_WHATSAPP_FROM")
     
     # Crisis Detection
+    CRISIS_RULES_PATH: str = "data/crisis_detection.json"
+    CRISIS_RESOURCES_PATH: str = "data/mental_health_resources.json"
+    CRISIS_RULES_RELOAD_INTERVAL_SECONDS: int = 30  # 0 disables the file watcher
+    CRISIS_SENTIMENT_BACKEND: str = "vader"  # 'vader' or 'embedding' (MiniLM sentiment head)
+    SENTIMENT_HEAD_PATH: str = "src/ml_models/sentiment_head.npz"
     CRISIS_DETECTION_THRESHOLD: int = 2
     GUARDIAN_ALERT_COOLDOWN_HOURS: int = 24
+    GUARDIAN_ALERT_TRANSPORT: str = "twilio"  # 'twilio', 'smtp' or 'stub'
+    GUARDIAN_ALERT_WORKERS: int = 2
+    GUARDIAN_ALERT_QUEUE_SIZE: int = 1000
+    GUARDIAN_ALERT_MAX_RETRIES: int = 3
+    GUARDIAN_ALERT_RETRY_BACKOFF_SECONDS: float = 2.0
+    GUARDIAN_ALERT_MAX_CONNECTIONS: int = 5
+    GUARDIAN_ALERT_RECORD_INTERVAL_SECONDS: float = 2.0
+    GUARDIAN_ALERT_RECORD_MAX_ATTEMPTS: int = 60  # Flushes a row survives while the database is unreachable
+    GUARDIAN_ALERT_MAX_PENDING_RECORDS: int = 10000  # Oldest unrecorded rows are dropped beyond this
+    GUARDIAN_ALERT_DRAIN_TIMEOUT_SECONDS: float = 15.0  # Shutdown wait for queued alerts; the rest stay pending
+    CRISIS_EXECUTOR_WORKERS: int = 2  # Threads dedicated to VADER/keyword scoring
+    CRISIS_EXECUTOR_MAX_PENDING: int = 64  # Requests queued on the pool before callers wait
+    CRISIS_INLINE_MAX_CHARS: int = 32  # Messages this short are scored on the event loop
+    CRISIS_CASCADE_ENABLED: bool = False  # Borderline messages wait on the LLM when on
+    CRISIS_BORDERLINE_LOW: float = 1.5  # Stage-one scores in [LOW, HIGH) go to the second stage
+    CRISIS_BORDERLINE_HIGH: float = 3.0
+    CRISIS_ESCALATION_MODEL: str = ""  # Defaults to OLLAMA_MODEL
+    CRISIS_ESCALATION_TIMEOUT_SECONDS: float = 2.0  # Deadline including the llm_scheduler wait
+    CRISIS_ESCALATION_CONCURRENCY: int = 4
+    CRISIS_LOG_BATCH_SIZE: int = 100
+    CRISIS_LOG_FLUSH_INTERVAL_SECONDS: float = 2.0
+    CRISIS_LOG_QUEUE_SIZE: int = 10000
+    CRISIS_LOG_SPILL_PATH: str = "crisis_log_spill.jsonl"
+    CRISIS_LOG_STOP_TIMEOUT_SECONDS: float = 12.0  # Shutdown wait for the flush task before spilling
+    CRISIS_CACHE_MAX_ENTRIES: int = 10000
+    CRISIS_CACHE_TTL_SECONDS: int = 3600
+    CRISIS_RESCAN_BATCH_SIZE: int = 500
+    CRISIS_RESCAN_WINDOW_SIZE: int = 10000  # Rows per keyset window (read in one short transaction, held in memory)
+    CRISIS_RESCAN_MAX_ROWS_PER_SEC: int = 2000  # 0 = unthrottled
+    CRISIS_RESCAN_CHECKPOINT_PATH: str = "crisis_rescan_checkpoint.json"
     
     # Data Retention
     CONVERSATION_RETENTION_DAYS: int = 30
     CRISIS_LOG_RETENTION_DAYS: int = 90
+    RETENTION_SWEEP_ENABLED: bool = False  # Opt in once retention periods are agreed
+    RETENTION_SWEEP_INTERVAL_SECONDS: int = 3600
+    RETENTION_BATCH_SIZE: int = 1000  # Rows per DELETE transaction
+    RETENTION_BATCH_PAUSE_SECONDS: float = 0.2  # Lets autovacuum and live traffic keep up
     
     # Logging
     LOG_LEVEL: str = "INFO"
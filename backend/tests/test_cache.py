@@ -0,0 +1,30 @@
+"""
+TTLCache peek versus get
+"""
+from src.utils.cache import TTLCache
+
+
+def test_peek_leaves_counters_and_lru_order_alone():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.peek("a") == 1
+    assert cache.peek("missing") is None
+    assert (cache.hits, cache.misses) == (0, 0)
+
+    # "a" is still least recently used, so it is the one evicted
+    cache.set("c", 3)
+    assert cache.peek("a") is None
+    assert cache.peek("b") == 2
+
+
+def test_peek_ignores_expired_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("src.utils.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(max_entries=2, ttl_seconds=10)
+    cache.set("a", 1)
+
+    now[0] += 11
+    assert cache.peek("a") is None
+    assert cache.misses == 0
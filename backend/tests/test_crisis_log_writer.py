@@ -0,0 +1,128 @@
+"""
+CrisisLogWriter spill file replay and shutdown behaviour
+"""
+import asyncio
+import json
+
+import pytest
+
+from src.services.crisis_log_writer import CrisisLogWriter
+from src.utils.config import settings
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CRISIS_LOG_SPILL_PATH", str(tmp_path / "crisis_log_spill.jsonl"))
+    monkeypatch.setattr(settings, "CRISIS_LOG_FLUSH_INTERVAL_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "CRISIS_LOG_STOP_TIMEOUT_SECONDS", 0.2)
+    return CrisisLogWriter()
+
+
+def _spill_events(writer, count):
+    """Write events straight to the spill file (no queue yet)"""
+    for user_id in range(count):
+        writer.submit(user_id, f"message {user_id}", 3, ["keyword"])
+
+
+def _spilled_user_ids(writer):
+    with open(writer.spill_path) as f:
+        return [json.loads(line)["user_id"] for line in f]
+
+
+def test_replay_skips_and_quarantines_torn_lines(writer):
+    _spill_events(writer, 2)
+    with open(writer.spill_path, "a") as f:
+        f.write('{"user_id": 7, "message_te')  # crash mid-write
+
+    written = []
+
+    async def flush(rows):
+        written.extend(rows)
+        return True
+
+    writer._flush = flush
+    asyncio.run(writer._replay_spill())
+
+    assert [row["user_id"] for row in written] == [0, 1]
+    assert not writer.spill_path.exists()
+    assert writer.corrupt_path.read_text() == '{"user_id": 7, "message_te\n'
+    stats = writer.stats()
+    assert stats["replayed"] == 2
+    assert stats["corrupt_spill_lines"] == 1
+
+
+def test_replay_failure_keeps_only_unwritten_rows(writer, monkeypatch):
+    monkeypatch.setattr(settings, "CRISIS_LOG_BATCH_SIZE", 1)
+    _spill_events(writer, 3)
+    calls = []
+
+    async def flush(rows):
+        calls.append(rows)
+        return len(calls) == 1
+
+    writer._flush = flush
+    asyncio.run(writer._replay_spill())
+
+    assert _spilled_user_ids(writer) == [1, 2]
+    stats = writer.stats()
+    assert stats["replayed"] == 1
+    assert stats["spilled"] == 3
+
+
+def test_stop_spills_batch_of_a_hung_flush(writer):
+    flushing = asyncio.Event()
+
+    async def hung_flush(rows):
+        flushing.set()
+        await asyncio.Event().wait()
+
+    async def scenario():
+        await writer.start()
+        writer._flush = hung_flush
+        writer.submit(1, "message", 3, ["keyword"])
+        await asyncio.wait_for(flushing.wait(), timeout=1)
+        writer.submit(2, "message", 3, ["keyword"])
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert _spilled_user_ids(writer) == [1, 2]
+
+
+def test_stop_with_full_queue_does_not_block(writer, monkeypatch):
+    monkeypatch.setattr(settings, "CRISIS_LOG_QUEUE_SIZE", 2)
+    written = []
+
+    async def flush(rows):
+        written.extend(rows)
+        return True
+
+    async def scenario():
+        await writer.start()
+        writer._flush = flush
+        _spill_events(writer, 3)  # the third overflows to disk
+        await asyncio.wait_for(writer.stop(), timeout=1)
+
+    asyncio.run(scenario())
+    assert [row["user_id"] for row in written] == [0, 1]
+    assert _spilled_user_ids(writer) == [2]
+
+
+def test_replay_after_failure_resends_the_same_event_ids(writer, monkeypatch):
+    monkeypatch.setattr(settings, "CRISIS_LOG_BATCH_SIZE", 1)
+    _spill_events(writer, 2)
+    with open(writer.spill_path) as f:
+        spilled_ids = [json.loads(line)["event_id"] for line in f]
+    attempts = []
+
+    async def flush(rows):
+        attempts.append(rows[0]["event_id"])
+        return len(attempts) != 2
+
+    writer._flush = flush
+    asyncio.run(writer._replay_spill())
+    asyncio.run(writer._replay_spill())
+
+    # The retried row keeps its id, so ON CONFLICT skips it if the first write had landed
+    assert len(set(spilled_ids)) == 2
+    assert attempts == [spilled_ids[0], spilled_ids[1], spilled_ids[1]]
+    assert not writer.spill_path.exists()
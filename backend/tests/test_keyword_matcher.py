@@ -0,0 +1,81 @@
+"""
+KeywordMatcher (Aho-Corasick) against a naive substring scan
+"""
+import random
+
+from src.services.keyword_matcher import KeywordMatcher, normalize_text
+
+
+def _naive_scan(matcher, text):
+    """Every (keyword_id, start, end) occurrence, found one phrase at a time"""
+    found = []
+    for keyword_id, keyword in enumerate(matcher.keywords):
+        start = text.find(keyword)
+        while start != -1:
+            found.append((keyword_id, start, start + len(keyword)))
+            start = text.find(keyword, start + 1)
+    return sorted(found)
+
+
+def test_overlapping_and_nested_keywords_with_offsets():
+    matcher = KeywordMatcher({
+        "self_harm": ["kill myself", "hurt myself"],
+        "hopelessness": ["myself", "no hope"],
+    })
+    text = normalize_text("I want to KILL   myself, no hope left")
+
+    matches = matcher.scan(text)
+
+    assert [(m.keyword, m.category) for m in matches] == [
+        ("kill myself", "self_harm"),
+        ("myself", "hopelessness"),
+        ("no hope", "hopelessness"),
+    ]
+    for match in matches:
+        assert text[match.start:match.end] == match.keyword
+
+
+def test_failure_links_find_suffix_matches():
+    matcher = KeywordMatcher({"a": ["she", "he", "hers", "his"]})
+
+    matches = matcher.scan("ushers")
+
+    assert sorted((m.keyword, m.start) for m in matches) == [("he", 2), ("hers", 2), ("she", 1)]
+
+
+def test_agrees_with_naive_scan():
+    rng = random.Random(1234)
+    alphabet = "abc "
+    phrases = {
+        f"category_{index}": [
+            "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))).strip() or "a"
+            for _ in range(5)
+        ]
+        for index in range(3)
+    }
+    matcher = KeywordMatcher(phrases)
+
+    for _ in range(200):
+        text = normalize_text("".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40))))
+        scanned = sorted((m.keyword_id, m.start, m.end) for m in matcher.scan(text))
+        assert scanned == _naive_scan(matcher, text)
+
+
+def test_phrases_are_normalized_and_blanks_skipped():
+    matcher = KeywordMatcher({"self_harm": ["  End   It All ", "", "   "]})
+
+    assert matcher.keywords == ["end it all"]
+    assert len(matcher) == 1
+
+
+def test_first_match_per_category_prefers_lowest_id():
+    matcher = KeywordMatcher({
+        "self_harm": ["kill myself", "end it"],
+        "hopelessness": ["hopeless"],
+    })
+    matches = matcher.scan(normalize_text("hopeless, want to end it, kill myself"))
+
+    best = matcher.first_match_per_category(matches)
+
+    assert best["self_harm"].keyword == "kill myself"
+    assert best["hopelessness"].keyword == "hopeless"
@@ -0,0 +1,187 @@
+"""
+LLMScheduler admission, ordering, deadlines and slot accounting
+"""
+import asyncio
+
+import pytest
+
+from src.services.llm_scheduler import (
+    LLMScheduler,
+    SchedulerRejected,
+    PRIORITY_URGENT,
+    PRIORITY_NORMAL,
+)
+from src.utils.config import settings
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_IN_FLIGHT", 1)
+    monkeypatch.setattr(settings, "LLM_QUEUE_MAX_SIZE", 2)
+    monkeypatch.setattr(settings, "LLM_QUEUE_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "LLM_RETRY_AFTER_SECONDS", 3)
+    return LLMScheduler()
+
+
+async def _settle():
+    """Let queued tasks run up to their next wait"""
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_admits_up_to_limit_then_queues(scheduler):
+    async def scenario():
+        granted_at = await scheduler.acquire()
+        assert scheduler.stats()["in_flight"] == 1
+
+        waiter = asyncio.create_task(scheduler.acquire())
+        await _settle()
+        assert not waiter.done()
+        assert scheduler.stats()["queue_depth"] == 1
+
+        scheduler.release(granted_at)
+        scheduler.release(await waiter)
+
+        stats = scheduler.stats()
+        assert stats["in_flight"] == 0
+        assert stats["queue_depth"] == 0
+        assert stats["admitted"] == 2
+        assert stats["admitted_immediately"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_urgent_waiters_go_first_and_fifo_within_priority(scheduler):
+    scheduler.max_queue = 3
+    order = []
+
+    async def request(name, priority):
+        granted_at = await scheduler.acquire(priority)
+        order.append(name)
+        await asyncio.sleep(0)
+        scheduler.release(granted_at)
+
+    async def scenario():
+        granted_at = await scheduler.acquire()
+        tasks = []
+        for name, priority in (("normal-1", PRIORITY_NORMAL), ("normal-2", PRIORITY_NORMAL), ("urgent", PRIORITY_URGENT)):
+            tasks.append(asyncio.create_task(request(name, priority)))
+            await _settle()
+
+        scheduler.release(granted_at)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["urgent", "normal-1", "normal-2"]
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_full_queue_rejects_with_retry_after(scheduler):
+    async def scenario():
+        granted_at = await scheduler.acquire()
+        waiters = [asyncio.create_task(scheduler.acquire()) for _ in range(2)]
+        await _settle()
+
+        with pytest.raises(SchedulerRejected) as rejected:
+            scheduler.check_admission(PRIORITY_NORMAL)
+        assert rejected.value.reason == "queue_full"
+        assert rejected.value.retry_after >= settings.LLM_RETRY_AFTER_SECONDS
+
+        with pytest.raises(SchedulerRejected) as rejected:
+            await scheduler.acquire(PRIORITY_NORMAL)
+        assert rejected.value.reason == "queue_full"
+
+        scheduler.release(granted_at)
+        for waiter in waiters:
+            scheduler.release(await waiter)
+
+    asyncio.run(scenario())
+    stats = scheduler.stats()
+    assert stats["rejected_queue_full"] == 2
+    assert stats["in_flight"] == 0
+
+
+def test_urgent_request_preempts_newest_normal_waiter(scheduler):
+    async def scenario():
+        granted_at = await scheduler.acquire()
+        oldest = asyncio.create_task(scheduler.acquire(PRIORITY_NORMAL))
+        await _settle()
+        newest = asyncio.create_task(scheduler.acquire(PRIORITY_NORMAL))
+        await _settle()
+
+        # Queue is full, but an urgent request still gets in
+        scheduler.check_admission(PRIORITY_URGENT)
+        urgent = asyncio.create_task(scheduler.acquire(PRIORITY_URGENT))
+        await _settle()
+
+        with pytest.raises(SchedulerRejected) as rejected:
+            await newest
+        assert rejected.value.reason == "preempted"
+
+        scheduler.release(granted_at)
+        scheduler.release(await urgent)
+        scheduler.release(await oldest)
+
+    asyncio.run(scenario())
+    stats = scheduler.stats()
+    assert stats["preempted"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+
+
+def test_waiter_expires_at_deadline(scheduler, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_QUEUE_TIMEOUT_SECONDS", 0.05)
+
+    async def scenario():
+        granted_at = await scheduler.acquire()
+        with pytest.raises(SchedulerRejected) as rejected:
+            await scheduler.acquire()
+        assert rejected.value.reason == "queue_timeout"
+        assert scheduler.stats()["queue_depth"] == 0
+        scheduler.release(granted_at)
+
+    asyncio.run(scenario())
+    stats = scheduler.stats()
+    assert stats["expired"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_cancel_while_waiting_leaves_no_queue_entry(scheduler):
+    async def scenario():
+        granted_at = await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire())
+        await _settle()
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.stats()["queue_depth"] == 0
+
+        scheduler.release(granted_at)
+        # The slot is free again, not handed to the cancelled waiter
+        scheduler.release(await scheduler.acquire())
+
+    asyncio.run(scenario())
+    stats = scheduler.stats()
+    assert stats["cancelled"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_cancel_after_grant_returns_the_slot(scheduler):
+    async def scenario():
+        granted_at = await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire())
+        await _settle()
+
+        # Hand the slot over, then cancel before the waiter gets to run
+        scheduler.release(granted_at)
+        assert scheduler.stats()["in_flight"] == 1
+        waiter.cancel()
+        try:
+            # Python 3.11's wait_for can deliver the grant instead of the cancellation
+            scheduler.release(await waiter)
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(scenario())
+    assert scheduler.stats()["in_flight"] == 0